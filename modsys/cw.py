@@ -5,11 +5,26 @@
 
 import random
 import heapq
+import bisect
 from collections import deque, defaultdict
-import matplotlib.pyplot as plt
+from functools import partial
+from itertools import chain, count
 import numpy as np
 from typing import List, Tuple, Dict, Optional
 import time
+import math
+import os
+import sys
+import json
+import pickle
+import sqlite3
+import zlib
+import hashlib
+import subprocess
+from dataclasses import dataclass, field, asdict
+import threading
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor
 
 # ============================================================================
 # КОНСТАНТЫ И ПАРАМЕТРЫ МОДЕЛИ
@@ -34,6 +49,11 @@ class Config:
     # Параметры для улучшенной системы
     IMPROVED_SYSTEM = False  # Флаг для включения улучшенной системы (2 прибора ЭВМ1-ок)
 
+    # Параметры записи истории приборов
+    RECORDING = 'summary'    # Уровень записи: 'off', 'summary' или 'full'
+    HISTORY_SIZE = 10000     # Размер кольцевого буфера истории (для 'full')
+    QUEUE_SERIES_POINTS = 5000  # Макс. число точек ряда длин очереди (0 - не записывать)
+
     # Цвета для визуализации
     COLORS = {
         'device': '#f8cecc',
@@ -45,22 +65,63 @@ class Config:
     }
 
 
+@dataclass(frozen=True)
+class ModelConfig:
+    """Неизменяемые параметры одного экземпляра модели
+
+    Значения по умолчанию берутся из Config в момент создания (from_defaults),
+    поэтому модели с разными параметрами могут работать в одном процессе.
+    """
+    GEN_MIN: float
+    GEN_MAX: float
+    PRIM_TIME: float
+    ANS_MIN: float
+    ANS_MAX: float
+    TRANS_TIME: float
+    P_LOCAL: float
+    TOTAL_REQUESTS: int
+    IMPROVED_SYSTEM: bool
+    RECORDING: str
+    HISTORY_SIZE: int
+    QUEUE_SERIES_POINTS: int
+
+    @classmethod
+    def from_defaults(cls, **overrides) -> 'ModelConfig':
+        """Текущие значения Config с заменой указанных параметров"""
+        values = {name: getattr(Config, name) for name in cls.__dataclass_fields__}
+        values.update(overrides)
+        return cls(**values)
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> 'ModelConfig':
+        """Параметры из словаря (лишние ключи, например COLORS, игнорируются)"""
+        return cls.from_defaults(**{name: value for name, value in values.items()
+                                    if name in cls.__dataclass_fields__})
+
+    def with_changes(self, **changes) -> 'ModelConfig':
+        """Копия с заменой указанных параметров"""
+        return type(self)(**{**asdict(self), **changes})
+
+
 # ============================================================================
 # ОСНОВНЫЕ КЛАССЫ МОДЕЛИ
 # ============================================================================
 
 class Request:
-    """Класс, представляющий заявку (запрос) в системе"""
-    _id_counter = 1
+    """Класс, представляющий заявку (запрос) в системе
 
-    def __init__(self, creation_time: float):
-        self.id = Request._id_counter
-        Request._id_counter += 1
+    Заявки хранятся в RequestStore; объект Request - лишь их представление
+    для вывода и отладки.
+    """
+
+    def __init__(self, id: int, creation_time: float, start_time=None,
+                 finish_time=None, path=None, queue_times=None):
+        self.id = id
         self.creation_time = creation_time  # Время создания заявки
-        self.start_time = None              # Время начала обслуживания
-        self.finish_time = None             # Время окончания обслуживания
-        self.path = None                    # Маршрут: 'local' или 'remote'
-        self.queue_times = {}               # Время ожидания в очередях
+        self.start_time = start_time        # Время начала обслуживания
+        self.finish_time = finish_time      # Время окончания обслуживания
+        self.path = path                    # Маршрут: 'local' или 'remote'
+        self.queue_times = queue_times or {}  # Время ожидания в очередях
 
     def total_time(self) -> float:
         """Общее время пребывания в системе"""
@@ -72,507 +133,1807 @@ class Request:
         return f"Request(id={self.id}, path={self.path}, time={self.total_time():.2f})"
 
 
-class Event:
-    """Класс события для календаря событий"""
-    def __init__(self, time: float, event_type: str, data=None):
-        self.time = time
-        self.event_type = event_type
-        self.data = data
+class RequestStore:
+    """Колоночное хранилище заявок
+
+    Поля заявок лежат в массивах NumPy, индексируемых целым id заявки (0, 1, ...):
+    время создания, начала и окончания обслуживания, код маршрута и матрица
+    времен ожидания (строка - заявка, столбец - очередь). Массивы выделяются
+    заранее и удваиваются при заполнении.
+    """
+
+    def __init__(self, queue_names: List[str], path_labels: List[str], capacity: int = 1024):
+        self.queue_names = list(queue_names)      # Имена очередей (столбцы матрицы ожиданий)
+        self.queue_index = {name: j for j, name in enumerate(self.queue_names)}
+        self.path_labels = list(path_labels)      # Метки маршрутов (индекс - код маршрута)
+        self.size = 0                             # Количество созданных заявок
+        self.n_finished = 0                       # Количество завершенных заявок
+        self.capacity = 0
+        self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity: int):
+        """Выделение (или расширение) массивов до заданной емкости"""
+        def grow(old, fill, dtype, width=None):
+            shape = (capacity,) if width is None else (capacity, width)
+            new = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                new[:self.capacity] = old[:self.capacity]
+            return new
+
+        first = self.capacity == 0
+        self.creation = grow(None if first else self.creation, np.nan, np.float64)
+        self.start = grow(None if first else self.start, np.nan, np.float64)
+        self.finish = grow(None if first else self.finish, np.nan, np.float64)
+        self.path = grow(None if first else self.path, -1, np.int8)
+        self.waits = grow(None if first else self.waits, 0.0, np.float64, len(self.queue_names))
+        self.finish_order = grow(None if first else self.finish_order, -1, np.int64)
+        self.capacity = capacity
+
+    def __getstate__(self):
+        # В контрольную точку попадают только заполненные строки массивов
+        n = self.size
+        return {
+            'queue_names': self.queue_names, 'path_labels': self.path_labels,
+            'capacity': self.capacity, 'size': n, 'n_finished': self.n_finished,
+            'creation': self.creation[:n], 'start': self.start[:n], 'finish': self.finish[:n],
+            'path': self.path[:n], 'waits': self.waits[:n],
+            'finish_order': self.finish_order[:self.n_finished],
+        }
 
-    def __lt__(self, other):
-        return self.time < other.time
+    def __setstate__(self, state):
+        self.__init__(state['queue_names'], state['path_labels'], state['capacity'])
+        n = self.size = state['size']
+        self.n_finished = state['n_finished']
+        for name in ('creation', 'start', 'finish', 'path', 'waits'):
+            getattr(self, name)[:n] = state[name]
+        self.finish_order[:self.n_finished] = state['finish_order']
+
+    def add(self, creation_time: float) -> int:
+        """Регистрация новой заявки, возвращает ее id"""
+        rid = self.size
+        if rid == self.capacity:
+            self._allocate(2 * self.capacity)
+        self.creation[rid] = creation_time
+        self.size = rid + 1
+        return rid
+
+    def finish_request(self, rid: int, finish_time: float):
+        """Отметка о завершении обслуживания заявки"""
+        self.finish[rid] = finish_time
+        self.finish_order[self.n_finished] = rid
+        self.n_finished += 1
+
+    def finished_ids(self) -> np.ndarray:
+        """id завершенных заявок в порядке завершения"""
+        return self.finish_order[:self.n_finished]
+
+    def path_code(self, label: str) -> int:
+        """Код маршрута по его метке"""
+        return self.path_labels.index(label)
+
+    def request(self, rid: int) -> Request:
+        """Представление заявки в виде объекта Request"""
+        code = int(self.path[rid])
+        finish = float(self.finish[rid])
+        start = float(self.start[rid])
+        return Request(
+            rid, float(self.creation[rid]),
+            start_time=None if np.isnan(start) else start,
+            finish_time=None if np.isnan(finish) else finish,
+            path=self.path_labels[code] if code >= 0 else None,
+            queue_times={name: float(self.waits[rid, j])
+                         for j, name in enumerate(self.queue_names) if self.waits[rid, j] > 0},
+        )
 
-    def __repr__(self):
-        return f"Event({self.event_type}, t={self.time:.2f})"
+    def nbytes(self) -> int:
+        """Объем памяти, занятый массивами хранилища"""
+        return sum(a.nbytes for a in (self.creation, self.start, self.finish,
+                                      self.path, self.waits, self.finish_order))
+
+
+class DecimatedSeries:
+    """Ряд (время, значение) ограниченного размера
+
+    Записывается каждая stride-я точка; при заполнении буфера каждая вторая
+    точка отбрасывается, а шаг stride удваивается.
+    """
+
+    def __init__(self, max_points: int):
+        self.max_points = max(int(max_points), 2)
+        self.stride = 1
+        self.times = []
+        self.values = []
+        self._skipped = 0
+
+    def add(self, t: float, value):
+        """Добавление точки с учетом текущего шага прореживания"""
+        self._skipped += 1
+        if self._skipped < self.stride:
+            return
+        self._skipped = 0
+        self.times.append(t)
+        self.values.append(value)
+        if len(self.times) >= self.max_points:
+            del self.times[1::2]
+            del self.values[1::2]
+            self.stride *= 2
+
+
+class QueueStats:
+    """Потоковая статистика очереди с интегрированием по модельному времени
+
+    Хранит площадь под графиком длины очереди, максимум и время пребывания
+    очереди в каждой длине; память не зависит от длительности прогона.
+    Изменения длины (время, длина) сначала накапливаются в списке pending
+    (его пополняют обработчики модели) и учитываются блоками по flush_size
+    в flush(); перед чтением показателей нужен вызов flush().
+    """
+
+    flush_size = 1024
+
+    def __init__(self, name: str, series_points: int = 0):
+        self.name = name
+        self.length = 0                  # Текущая длина очереди
+        self.max_length = 0              # Максимальная длина очереди
+        self.last_time = 0.0             # Время последнего изменения длины
+        self.area = 0.0                  # Интеграл длины очереди по времени
+        self.time_at_length = [0.0]      # Время пребывания в каждой длине
+        self.series = DecimatedSeries(series_points) if series_points else None
+        self.pending = []                # Еще не учтенные изменения (время, длина)
+
+    def update(self, now: float, length: int):
+        """Учет изменения длины очереди в момент now"""
+        self.pending.append((now, length))
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Учет накопленных изменений длины одним проходом по массивам
+
+        Модельное время не убывает, поэтому длина до i-го изменения держалась с
+        момента предыдущего изменения. Площадь и времена пребывания
+        накапливаются последовательно (cumsum, add.at), в том же порядке, что и
+        при поштучном учете, поэтому результат совпадает до бита.
+        """
+        pending = self.pending
+        if not pending:
+            return
+        times, lengths = zip(*pending)
+        times = np.array(times)
+        lengths = np.array(lengths, dtype=np.int64)
+        pending.clear()
+
+        levels = np.empty_like(lengths)
+        levels[0] = self.length
+        levels[1:] = lengths[:-1]
+        dt = np.diff(times, prepend=self.last_time)
+        peak = int(lengths.max())
+        if peak > self.max_length:
+            self.max_length = peak
+            self.time_at_length.extend([0.0] * (peak + 1 - len(self.time_at_length)))
+        held = dt > 0
+        if held.any():
+            dt, levels = dt[held], levels[held]
+            self.area = float(np.cumsum(np.concatenate(([self.area], levels * dt)))[-1])
+            time_at_length = np.array(self.time_at_length)
+            np.add.at(time_at_length, levels, dt)
+            self.time_at_length = time_at_length.tolist()
+            self.last_time = float(times[held][-1])
+        self.length = int(lengths[-1])
+        if self.series is not None:
+            self._add_series(times, lengths)
+
+    def _add_series(self, times: np.ndarray, lengths: np.ndarray):
+        """Прореживание изменений длины в ряд series (как DecimatedSeries.add по одному)"""
+        series = self.series
+        n, index = times.size, 0
+        while index < n:
+            first = index + series.stride - series._skipped - 1
+            if first >= n:
+                series._skipped += n - index
+                return
+            room = series.max_points - len(series.times)
+            count = min(room, (n - 1 - first) // series.stride + 1)
+            stop = first + (count - 1) * series.stride + 1
+            series.times.extend(times[first:stop:series.stride].tolist())
+            series.values.extend(lengths[first:stop:series.stride].tolist())
+            series._skipped = 0
+            index = stop
+            if len(series.times) >= series.max_points:
+                del series.times[1::2]
+                del series.values[1::2]
+                series.stride *= 2
+
+    def mean(self, total_time: float) -> float:
+        """Средняя по времени длина очереди"""
+        self.flush()
+        return self.area / total_time if total_time > 0 else 0.0
+
+    def distribution(self) -> np.ndarray:
+        """Доля времени, проведенного очередью в каждой длине"""
+        self.flush()
+        times = np.asarray(self.time_at_length)
+        total = times.sum()
+        return times / total if total > 0 else times
+
+
+class BinnedQueueStats(QueueStats):
+    """Статистика очереди с накоплением площади по интервалам времени bin_width
+
+    Средние длины по интервалам - наблюдения для анализа стационарного режима.
+    """
+
+    def __init__(self, name: str, series_points: int = 0, bin_width: float = 100.0):
+        super().__init__(name, series_points)
+        self.bin_width = bin_width
+        self.bin_area = []               # Интеграл длины очереди по каждому интервалу
+
+    def flush(self):
+        """Распределение площади по интервалам, затем общий учет (QueueStats.flush)"""
+        t, level = self.last_time, self.length
+        width, bins = self.bin_width, self.bin_area
+        for now, length in self.pending:
+            if now > t:
+                if level:
+                    k, last = int(t // width), int(now // width)
+                    if last >= len(bins):
+                        bins.extend([0.0] * (last + 1 - len(bins)))
+                    while k < last:
+                        edge = (k + 1) * width
+                        bins[k] += level * (edge - t)
+                        t, k = edge, k + 1
+                    bins[k] += level * (now - t)
+                t = now
+            level = length
+        super().flush()
+
+    def bin_means(self, total_time: float) -> np.ndarray:
+        """Средние длины очереди по полным интервалам до момента total_time"""
+        self.flush()
+        n_bins = int(total_time // self.bin_width)
+        areas = np.zeros(n_bins)
+        filled = min(n_bins, len(self.bin_area))
+        areas[:filled] = self.bin_area[:filled]
+        return areas / self.bin_width
+
+
+# Уровни записи истории приборов:
+#   off     - только время занятости и число обслуженных заявок
+#   summary - дополнительно счетчики O(1): начатые обслуживания, сумма и
+#             сумма квадратов времен обслуживания, пиковая занятость
+#   full    - дополнительно последние события в кольцевом буфере
+RECORDING_LEVELS = ('off', 'summary', 'full')
 
 
 class Device:
-    """Класс, представляющий прибор обслуживания"""
-    def __init__(self, name: str, service_time_func, max_parallel=1):
+    """Класс, представляющий узел сети: очередь и группу параллельных приборов"""
+    def __init__(self, name: str, service_time_func, max_parallel=1,
+                 service_const: Optional[float] = None, queue_name: Optional[str] = None,
+                 recording: str = 'summary', history_size: int = 10000):
+        if recording not in RECORDING_LEVELS:
+            raise ValueError(f"Неизвестный уровень записи: {recording}")
+
         self.name = name
         self.service_time_func = service_time_func  # Функция генерации времени обслуживания
+        self.service_const = service_const          # Детерминированное время обслуживания (если задано)
         self.max_parallel = max_parallel            # Максимальное количество параллельных обрабок
+        self.queue_name = queue_name                # Имя учитываемой очереди (None - внутренняя очередь)
+        self.recording = recording                  # Уровень записи истории
         self.parallel_count = 0                     # Текущее количество обрабатываемых заявок
-        self.queue = deque()                        # Очередь заявок
-        self.history = []                           # История состояний прибора
+        self.queue = deque()                        # Очередь заявок: (время постановки, заявка)
+        self.in_service = {}                        # id заявки -> (время начала, время обслуживания)
         self.total_processed = 0                    # Общее количество обработанных заявок
         self.busy_time = 0.0                        # Общее время занятости
 
+        # Счетчики уровня 'summary'
+        self.total_started = 0                      # Количество начатых обслуживаний
+        self.service_time_sum = 0.0                 # Сумма времен обслуживания
+        self.service_time_sq_sum = 0.0              # Сумма квадратов времен обслуживания
+        self.peak_parallel = 0                      # Пиковое число занятых приборов
+
+        # История состояний прибора (кольцевой буфер уровня 'full')
+        self.history = deque(maxlen=history_size) if recording == 'full' else None
+
+    def __getstate__(self):
+        # Функция генерации времени обслуживания восстанавливается моделью
+        state = self.__dict__.copy()
+        state['service_time_func'] = None
+        return state
+
     def is_available(self) -> bool:
         """Проверка, доступен ли прибор для обслуживания"""
         return self.parallel_count < self.max_parallel
 
-    def can_accept(self) -> bool:
-        """Может ли прибор принять новую заявку"""
-        return True  # По умолчанию не ограничено
+    def queue_length(self) -> int:
+        """Текущая длина очереди"""
+        return len(self.queue)
 
-    def start_service(self, request: Request, current_time: float) -> float:
-        """Начать обслуживание заявки, вернуть время окончания"""
-        if not self.is_available():
-            raise Exception(f"Device {self.name} is not available")
+    def utilization(self, total_time: float) -> float:
+        """Коэффициент загрузки прибора"""
+        if total_time > 0:
+            return self.busy_time / total_time
+        return 0.0
 
-        self.parallel_count += 1
-        request.start_time = current_time
-        service_time = self.service_time_func()
-        end_time = current_time + service_time
+    def summary(self) -> Dict:
+        """Сводные счетчики прибора (пустой словарь при уровне записи 'off')"""
+        if self.recording == 'off':
+            return {}
 
-        # Запись в историю
-        self.history.append((current_time, 'start', request.id, service_time))
+        n = self.total_started
+        mean = self.service_time_sum / n if n else 0.0
+        var = self.service_time_sq_sum / n - mean ** 2 if n else 0.0
+        return {
+            'started': n,
+            'in_service': len(self.in_service),
+            'peak_parallel': self.peak_parallel,
+            'service_time_mean': mean,
+            'service_time_std': var ** 0.5 if var > 0 else 0.0,
+        }
 
-        return end_time
 
-    def finish_service(self, request: Request, current_time: float):
-        """Завершить обслуживание заявки"""
-        self.parallel_count -= 1
-        self.total_processed += 1
-        request.finish_time = current_time
+# ============================================================================
+# ИСТОЧНИКИ СЛУЧАЙНЫХ ВЕЛИЧИН
+# ============================================================================
 
-        # Обновление времени занятости
-        if request.start_time:
-            self.busy_time += (current_time - request.start_time)
+# Независимые источники случайности модели (потоки случайных чисел)
+VARIATE_STREAMS = ('arrival', 'routing', 'ev1_answer', 'ev2_answer')
 
-        # Запись в историю
-        self.history.append((current_time, 'finish', request.id))
 
-    def add_to_queue(self, request: Request, current_time: float):
-        """Добавить заявку в очередь"""
-        self.queue.append((current_time, request))
-        return len(self.queue)
+def stream_generators(seed_seq: np.random.SeedSequence) -> Dict[str, np.random.Generator]:
+    """Генераторы NumPy для каждого потока, порожденные из одной SeedSequence
 
-    def get_from_queue(self, current_time: float) -> Tuple[Request, float]:
-        """Извлечь заявку из очереди"""
-        if not self.queue:
-            return None, 0.0
+    Дочерние последовательности совпадают с первым seed_seq.spawn(), но сама
+    seed_seq не изменяется: повторный вызов дает те же потоки (общие случайные
+    числа для прогонов с одинаковой SeedSequence).
+    """
+    return {name: np.random.Generator(np.random.PCG64(np.random.SeedSequence(
+                seed_seq.entropy, spawn_key=seed_seq.spawn_key + (i,), pool_size=seed_seq.pool_size)))
+            for i, name in enumerate(VARIATE_STREAMS)}
 
-        queue_time, request = self.queue.popleft()
-        wait_time = current_time - queue_time
-        request.queue_times[self.name] = wait_time
-        return request, wait_time
 
-    def queue_length(self) -> int:
-        """Текущая длина очереди"""
-        return len(self.queue)
+class RandomVariates:
+    """Источник случайных величин на одном генераторе random.Random
 
-    def utilization(self, total_time: float) -> float:
-        """Коэффициент загрузки прибора"""
-        if total_time > 0:
-            return self.busy_time / total_time
-        return 0.0
+    Все потоки берут числа из одного генератора в порядке обращения к ним
+    (поведение исходной модели с глобальным random.seed()).
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else random
+
+    def __getstate__(self):
+        # Состояние генератора точное (без буферизации), смещения потоков не нужны
+        return {'state': self.rng.getstate(), 'shared': self.rng is random}
+
+    def __setstate__(self, state):
+        if state['shared']:
+            self.rng = random
+        else:
+            self.rng = random.Random()
+        self.rng.setstate(state['state'])
+
+    def resume_at(self, counts: Dict[str, int]):
+        """Продолжение после контрольной точки (состояние уже восстановлено)"""
+
+    def uniform(self, stream: str, low: float, high: float):
+        """Функция без аргументов, возвращающая U(low, high) из потока stream
+
+        Вычисление то же, что в random.uniform (low + (high - low) * random()),
+        но без вызова метода генератора на каждое значение.
+        """
+        draw, span = self.rng.random, high - low
+        return lambda: low + span * draw()
+
+    def uniform01(self, stream: str):
+        """Функция без аргументов, возвращающая U(0, 1) из потока stream"""
+        return self.rng.random
+
+
+class BufferedVariates:
+    """Потоковый источник на генераторах NumPy с блочной генерацией
+
+    Каждый поток имеет собственный генератор (stream_generators) и получает
+    числа блоками по block_size, которые выдаются по одному до исчерпания
+    блока. Последовательность каждого потока совпадает с gen.random(n) при
+    любом block_size, поэтому те же числа можно получить векторно.
+    antithetic - выдаются антитетические значения 1 - u вместо u: во всех
+    потоках (True) или в перечисленных.
+    """
+
+    def __init__(self, seed_seq=None, block_size=4096, antithetic=False):
+        if not isinstance(seed_seq, np.random.SeedSequence):
+            seed_seq = np.random.SeedSequence(seed_seq)
+        self.seed_seq = seed_seq
+        self.generators = stream_generators(seed_seq)
+        self.block_size = block_size
+        self.antithetic = frozenset(VARIATE_STREAMS if antithetic is True else antithetic or ())
+        self.offsets = {}                # Пропускаемые числа потоков (после контрольной точки)
+
+    def __getstate__(self):
+        # Генераторы восстанавливаются из SeedSequence, позиция - через resume_at()
+        return {'seed_seq': self.seed_seq, 'block_size': self.block_size,
+                'antithetic': self.antithetic}
+
+    def __setstate__(self, state):
+        self.__init__(state['seed_seq'], state['block_size'], state.get('antithetic', False))
+
+    def resume_at(self, counts: Dict[str, int]):
+        """Продолжение потоков после counts[поток] уже выданных чисел"""
+        self.offsets.update(counts)
+
+    def _blocks(self, stream: str, low: float, scale: float):
+        """Бесконечная последовательность чисел потока, генерируемых блоками"""
+        generator = self.generators[stream]
+        offset = self.offsets.pop(stream, 0)
+        if offset:
+            # random() расходует ровно одно 64-битное число генератора на значение
+            generator.bit_generator.advance(offset)
+        random_block = partial(generator.random, self.block_size)
+        if stream in self.antithetic:
+            # low + scale * (1 - u) = (low + scale) - scale * u
+            low, scale = low + scale, -scale
+        if low == 0.0 and scale == 1.0:
+            blocks = iter(lambda: random_block().tolist(), None)
+        else:
+            blocks = iter(lambda: (low + scale * random_block()).tolist(), None)
+        return chain.from_iterable(blocks).__next__
+
+    def uniform(self, stream: str, low: float, high: float):
+        """Функция без аргументов, возвращающая U(low, high) из потока stream"""
+        return self._blocks(stream, low, high - low)
+
+    def uniform01(self, stream: str):
+        """Функция без аргументов, возвращающая U(0, 1) из потока stream"""
+        return self._blocks(stream, 0.0, 1.0)
+
+
+class ArrayVariates:
+    """Источник, воспроизводящий заранее заданные U(0, 1) по каждому потоку
+
+    Используется для сверки движков моделирования на одинаковых входных данных.
+    """
+
+    def __init__(self, uniforms: Dict[str, np.ndarray]):
+        self.uniforms = {name: np.asarray(values, dtype=float) for name, values in uniforms.items()}
+        self.offsets = {}
+
+    def resume_at(self, counts: Dict[str, int]):
+        """Продолжение потоков после counts[поток] уже выданных чисел"""
+        self.offsets.update(counts)
+
+    def _values(self, stream: str):
+        return iter(self.uniforms[stream][self.offsets.pop(stream, 0):].tolist())
+
+    def uniform(self, stream: str, low: float, high: float):
+        """Функция без аргументов, возвращающая U(low, high) из потока stream"""
+        values = self._values(stream)
+        scale = high - low
+        return lambda: low + scale * next(values)
+
+    def uniform01(self, stream: str):
+        """Функция без аргументов, возвращающая U(0, 1) из потока stream"""
+        return self._values(stream).__next__
 
 
 # ============================================================================
-# КЛАСС МОДЕЛИ
+# ПОДГОТОВКА ДАННЫХ ДЛЯ ГРАФИКОВ
 # ============================================================================
 
-class DistributedDBModel:
-    """Основной класс имитационной модели распределенного банка данных"""
+def _pyplot(show=False):
+    """Импорт pyplot; без вывода на экран - с неинтерактивным бэкендом Agg"""
+    import matplotlib
+    if not show and 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
-    def __init__(self, improved_system=False, max_queue_size=None):
-        # Параметры системы
-        self.improved = improved_system
-        self.max_queue_size = max_queue_size
 
-        # Временные переменные
-        self.current_time = 0.0
-        self.event_list = []  # Календарь событий (куча)
+def _finish_figure(plt, fig, save_path=None, show=False, dpi=300):
+    """Сохранение и вывод фигуры; без вывода на экран фигура закрывается"""
+    if save_path:
+        fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+def minmax_downsample(x, y, max_points: int):
+    """Прореживание ряда с сохранением минимумов и максимумов
+
+    Ряд делится на max_points / 2 равных групп, от каждой остаются точки
+    минимума и максимума (в исходном порядке), а также первая и последняя
+    точки ряда. Огибающая ступенчатого графика при этом не меняется.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    n = y.size
+    if n <= max_points:
+        return x, y
+    n_groups = max(1, max_points // 2)
+    size = -(-n // n_groups)
+    padded = np.empty(n_groups * size, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    groups = padded.reshape(n_groups, size)
+    offsets = np.arange(n_groups) * size
+    index = np.concatenate([[0, n - 1],
+                            offsets + groups.argmin(axis=1),
+                            offsets + groups.argmax(axis=1)])
+    index = np.unique(np.minimum(index, n - 1))
+    return x[index], y[index]
+
+
+def lttb_downsample(x, y, max_points: int):
+    """Прореживание ряда алгоритмом Largest-Triangle-Three-Buckets
+
+    Из каждой группы выбирается точка, образующая наибольший треугольник с
+    выбранной точкой предыдущей группы и средним следующей; форма кривой
+    сохраняется лучше, чем при равномерном прореживании.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = y.size
+    if n <= max_points or max_points < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    index = np.empty(max_points, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    selected = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:max(nxt_hi, nxt_lo + 1)].mean()
+        avg_y = y[nxt_lo:max(nxt_hi, nxt_lo + 1)].mean()
+        area = np.abs((x[selected] - avg_x) * (y[lo:hi] - y[selected])
+                      - (x[selected] - x[lo:hi]) * (avg_y - y[selected]))
+        selected = lo + int(np.argmax(area))
+        index[i + 1] = selected
+    return x[index], y[index]
+
+
+def downsample(x, y, max_points: int, method='minmax'):
+    """Прореживание ряда до max_points точек: 'minmax' или 'lttb'"""
+    if method == 'minmax':
+        return minmax_downsample(x, y, max_points)
+    if method == 'lttb':
+        return lttb_downsample(x, y, max_points)
+    raise ValueError(f"Неизвестный метод прореживания: {method}")
+
+
+def _plot_histogram(ax, values, bins=30, **style):
+    """Гистограмма по заранее подсчитанным частотам (вместо ax.hist по всем значениям)"""
+    counts, edges = np.histogram(values, bins=bins)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', **style)
 
-        # Счетчики
-        self.request_counter = 0
-        self.processed_requests = 0
-        self.lost_requests = 0
 
-        # Списки заявок
-        self.active_requests = []
-        self.finished_requests = []
+# ============================================================================
+# ИНСТРУМЕНТИРОВАНИЕ
+# ============================================================================
 
-        # Инициализация приборов
-        self._init_devices()
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый объем резидентной памяти процесса (МБ); None, если недоступно"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Profiler:
+    """Счетчики и время обработчиков событий модели
+
+    Подключается через DistributedDBModel(profiler=Profiler()): обработчики
+    в таблице слотов оборачиваются замером perf_counter_ns (время включает
+    вложенные вызовы начала обслуживания и маршрутизации). Каждые every
+    событий записывается размер календаря и вызывается callback(snapshot).
+    Без профилировщика таблица обработчиков не изменяется.
+    """
+
+    def __init__(self, every: int = 10000, callback=None):
+        self.every = every
+        self.callback = callback
+        self.names = []
+        self.counts = []
+        self.times_ns = []
+        self.events = 0
+        self.next_sample = every
+        self.samples = []                # (модельное время, событий, размер календаря, сек)
+        self.heap_max = 0
+        self.wall_start = None
+        self.wall_time = 0.0
+        self.model = None
+
+    def attach(self, model):
+        """Оборачивание обработчиков модели"""
+        self.model = model
+        stations = [spec['name'] for spec in model.topology['stations']]
+        self.names = ['ARRIVAL'] + [f'{name}_END' for name in stations]
+        self.counts = [0] * len(self.names)
+        self.times_ns = [0] * len(self.names)
+        handlers = model._handlers
+        for slot, handler in enumerate(handlers):
+            handlers[slot] = self._wrap(slot, handler)
+
+    def _wrap(self, slot: int, handler):
+        """Обработчик с подсчетом вызовов и времени"""
+        counts, times_ns = self.counts, self.times_ns
+        clock = time.perf_counter_ns
+
+        def timed(now, data):
+            begin = clock()
+            handler(now, data)
+            times_ns[slot] += clock() - begin
+            counts[slot] += 1
+            self.events += 1
+            if self.events >= self.next_sample:
+                self._sample(now)
+        return timed
+
+    def _sample(self, now: float):
+        """Запись размера календаря и вызов callback"""
+        self.next_sample += self.every
+        heap_size = len(self.model.event_list)
+        self.heap_max = max(self.heap_max, heap_size)
+        elapsed = time.perf_counter() - self.wall_start if self.wall_start else 0.0
+        self.samples.append((now, self.events, heap_size, elapsed))
+        if self.callback is not None:
+            self.callback(self.snapshot())
+
+    def begin(self):
+        """Начало замера реального времени (вызывается из run)"""
+        self.wall_start = time.perf_counter()
+
+    def end(self):
+        """Окончание замера реального времени (вызывается из run)"""
+        if self.wall_start is not None:
+            self.wall_time += time.perf_counter() - self.wall_start
+            self.wall_start = None
+
+    def snapshot(self) -> Dict:
+        """Текущие показатели: события, скорость, размер календаря"""
+        elapsed = self.wall_time
+        if self.wall_start is not None:
+            elapsed += time.perf_counter() - self.wall_start
+        return {
+            'model_time': self.model.current_time,
+            'events': self.events,
+            'wall_time': elapsed,
+            'events_per_sec': self.events / elapsed if elapsed > 0 else 0.0,
+            'heap_size': len(self.model.event_list),
+            'processed_requests': self.model.processed_requests,
+        }
 
-        # Статистика
-        self.stats = {
-            'queue_lengths': defaultdict(list),  # История длин очередей
-            'queue_max': defaultdict(int),        # Максимальные длины очередей
-            'queue_avg': defaultdict(float),      # Средние длины очередей
-            'queue_samples': defaultdict(int),    # Количество замеров для очередей
-            'wait_times': defaultdict(list),      # Время ожидания в очередях
-            'service_times': [],                  # Время обслуживания
-            'system_times': [],                   # Время в системе
-            'events_processed': 0,                # Количество обработанных событий
-            'last_stat_time': 0.0,                # Время последнего сбора статистики
+    def report(self) -> Dict:
+        """Итоговый отчет: обработчики, скорость, календарь, пиковая память"""
+        total_ns = sum(self.times_ns)
+        handlers = {}
+        for name, n, ns in zip(self.names, self.counts, self.times_ns):
+            handlers[name] = {
+                'count': n,
+                'time': ns / 1e9,
+                'mean_us': ns / n / 1e3 if n else 0.0,
+                'share': ns / total_ns if total_ns else 0.0,
+            }
+        heap_sizes = [s[2] for s in self.samples]
+        return {
+            **self.snapshot(),
+            'handlers': handlers,
+            'handler_time': total_ns / 1e9,
+            'heap': {
+                'max': self.heap_max,
+                'mean': float(np.mean(heap_sizes)) if heap_sizes else 0.0,
+                'samples': self.samples,
+            },
+            'peak_rss_mb': peak_rss_mb(),
         }
 
-    def _init_devices(self):
-        """Инициализация всех приборов системы"""
+    def print_report(self):
+        """Вывод отчета профилирования"""
+        report = self.report()
+        print(f"\nПрофиль: {report['events']} событий за {report['wall_time']:.3f} сек "
+              f"({report['events_per_sec']:.0f} соб/сек), "
+              f"календарь до {report['heap']['max']} событий, "
+              f"пиковая память {report['peak_rss_mb'] or 0:.1f} МБ")
+        for name, h in sorted(report['handlers'].items(), key=lambda item: -item[1]['time']):
+            print(f"   {name:<18}: {h['count']:>9} вызовов, {h['time']:8.3f} сек, "
+                  f"{h['mean_us']:7.2f} мкс, {h['share']:6.1%}")
 
-        # Функции генерации времен обслуживания
-        def gen_interarrival():
-            return random.uniform(Config.GEN_MIN, Config.GEN_MAX)
 
-        def gen_answer_time():
-            return random.uniform(Config.ANS_MIN, Config.ANS_MAX)
+# ============================================================================
+# ТРАССИРОВКА СОБЫТИЙ
+# ============================================================================
+
+# Типы записей трассы
+TRACE_EVENTS = ('arrival', 'start', 'finish', 'lost')
+TRACE_ARRIVAL, TRACE_START, TRACE_FINISH, TRACE_LOST = range(len(TRACE_EVENTS))
+
+
+def trace_dtype(n_queues: int) -> np.dtype:
+    """Структура записи трассы: время, тип, узел, заявка, длины учитываемых очередей"""
+    return np.dtype([('time', 'f8'), ('event', 'u1'), ('station', 'u1'),
+                     ('rid', 'i8'), ('queues', 'i4', (n_queues,))])
+
+
+class TraceWriter:
+    """Запись трассы событий на диск блоками фиксированного размера
+
+    Записи накапливаются в списке и по заполнении блока (chunk_size записей)
+    передаются фоновому потоку, который сохраняет их как структурированный
+    массив NumPy в файл chunk_NNNNNN.npy каталога directory. Очередь блоков
+    ограничена max_pending, поэтому в памяти находится не более нескольких
+    блоков независимо от длины прогона. Описание трассы - в meta.json.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 1 << 16, max_pending: int = 4):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.n_chunks = 0
+        self.n_records = 0
+        self.queues = ()
+        self.dtype = None
+        self.meta = {}
+        self._pending = Queue(maxsize=max_pending)
+        self._thread = None
+        self._error = None
+
+    def open(self, stations: List[str], queue_names: List[str], queues: List):
+        """Начало записи: имена узлов и очередей, объекты очередей для снимка длин"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.queues = tuple(queues)
+        self.dtype = trace_dtype(len(self.queues))
+        self.meta = {'stations': list(stations), 'queues': list(queue_names),
+                     'events': list(TRACE_EVENTS), 'chunk_size': self.chunk_size}
+        self._thread = threading.Thread(target=self._flush_worker, daemon=True)
+        self._thread.start()
+
+    def record(self, now: float, event: int, station: int, rid: int):
+        """Добавление записи о событии со снимком длин очередей"""
+        self.buffer.append((now, event, station, rid, tuple(map(len, self.queues))))
+        if len(self.buffer) >= self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        """Передача накопленного блока фоновому потоку"""
+        if self._error is not None:
+            raise self._error
+        self._pending.put((self.n_chunks, self.buffer))
+        self.n_records += len(self.buffer)
+        self.n_chunks += 1
+        self.buffer = []
+
+    def _flush_worker(self):
+        """Фоновое сохранение блоков до получения None"""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            index, records = item
+            try:
+                np.save(os.path.join(self.directory, f'chunk_{index:06d}.npy'),
+                        np.array(records, dtype=self.dtype))
+            except Exception as error:
+                self._error = error
+            self._pending.task_done()
+
+    def __getstate__(self):
+        # Для контрольной точки: накопленные записи сохраняются на диск,
+        # при продолжении запись идет со следующего номера блока
+        if self._thread is not None:
+            if self.buffer:
+                self._submit()
+            self._pending.join()
+        return {'directory': self.directory, 'chunk_size': self.chunk_size,
+                'n_chunks': self.n_chunks, 'n_records': self.n_records,
+                'max_pending': self._pending.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['chunk_size'], state['max_pending'])
+        self.n_chunks = state['n_chunks']
+        self.n_records = state['n_records']
+
+    def close(self):
+        """Сохранение последнего блока, ожидание фонового потока и запись meta.json"""
+        if self._thread is None:
+            return
+        if self.buffer:
+            self._submit()
+        self._pending.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise self._error
+        self.meta.update(n_chunks=self.n_chunks, n_records=self.n_records)
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+
+class TraceReader:
+    """Чтение трассы событий: блоки отображаются в память (np.load с mmap_mode)"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.stations = self.meta['stations']
+        self.queue_names = self.meta['queues']
+
+    def __len__(self):
+        return self.meta['n_records']
+
+    def chunks(self):
+        """Блоки трассы по порядку (структурированные массивы в режиме mmap)"""
+        for index in range(self.meta['n_chunks']):
+            yield np.load(os.path.join(self.directory, f'chunk_{index:06d}.npy'), mmap_mode='r')
+
+    def select(self, event: Optional[str] = None, station: Optional[str] = None,
+               fields: Tuple[str, ...] = ('time', 'rid')) -> Dict[str, np.ndarray]:
+        """Поля записей с заданным типом события и/или узлом"""
+        event_code = TRACE_EVENTS.index(event) if event is not None else None
+        station_code = self.stations.index(station) if station is not None else None
+        parts = {name: [] for name in fields}
+        for chunk in self.chunks():
+            mask = np.ones(len(chunk), dtype=bool)
+            if event_code is not None:
+                mask &= chunk['event'] == event_code
+            if station_code is not None:
+                mask &= chunk['station'] == station_code
+            for name in fields:
+                parts[name].append(np.asarray(chunk[name][mask]))
+        return {name: np.concatenate(values) if values else np.empty(0)
+                for name, values in parts.items()}
+
+    def queue_series(self, max_points: int = 5000) -> Tuple[np.ndarray, np.ndarray]:
+        """Моменты времени и длины очередей с прореживанием до max_points точек"""
+        stride = max(1, -(-len(self) // max_points))
+        times, lengths = [], []
+        offset = 0
+        for chunk in self.chunks():
+            # Прореживание с единым шагом по всей трассе, а не внутри блока
+            first = (-offset) % stride
+            times.append(np.asarray(chunk['time'][first::stride]))
+            lengths.append(np.asarray(chunk['queues'][first::stride]))
+            offset += len(chunk)
+        if not times:
+            return np.empty(0), np.empty((0, len(self.queue_names)), dtype=np.int32)
+        return np.concatenate(times), np.concatenate(lengths)
+
+    def plot_queues(self, max_points: int = 5000, save_path=None, show=False):
+        """График длин очередей по трассе"""
+        plt = _pyplot(show)
+
+        # Равномерная выборка с запасом, затем прореживание с сохранением экстремумов
+        times, lengths = self.queue_series(max_points * 10)
+        fig, ax = plt.subplots(figsize=(14, 5))
+        for i, name in enumerate(self.queue_names):
+            x, y = minmax_downsample(times, lengths[:, i], max_points)
+            ax.plot(x, y, label=name, drawstyle='steps-post', linewidth=1)
+        ax.set_xlabel('Время (сек)')
+        ax.set_ylabel('Длина очереди')
+        ax.set_title('Длины очередей по трассе событий')
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+        plt.tight_layout()
+        _finish_figure(plt, fig, save_path, show)
+
+
+# ============================================================================
+# КАЛЕНДАРЬ СОБЫТИЙ
+# ============================================================================
+#
+# Событие - кортеж (время, порядковый номер, слот, данные). Порядковый номер
+# уникален и возрастает, поэтому события одного момента извлекаются в порядке
+# планирования при любой реализации календаря. Интерфейс календаря:
+#   push(событие), popmin() -> событие, peek() -> событие, discard(событие),
+#   len(); pickle сохраняет только сами события.
+
+class HeapEventList(list):
+    """Двоичная куча на списке (heapq)
+
+    push и popmin - частично примененные функции heapq без промежуточного
+    вызова метода, поэтому куча не медленнее прямого использования heapq.
+    """
+
+    name = 'heap'
+
+    def __init__(self, events=()):
+        super().__init__(events)
+        heapq.heapify(self)
+        self.push = partial(heapq.heappush, self)
+        self.popmin = partial(heapq.heappop, self)
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    def peek(self):
+        return self[0]
+
+    def discard(self, event):
+        self.remove(event)
+        heapq.heapify(self)
+
+
+class CalendarQueue:
+    """Календарная очередь Брауна: кольцо упорядоченных корзин ширины width
+
+    Событие попадает в корзину int(время / width) % n_buckets. Число корзин
+    удваивается и уменьшается вдвое вслед за числом событий, ширина при этом
+    оценивается по интервалам между ближайшими событиями; вставка и извлечение
+    в среднем O(1).
+    """
+
+    name = 'calendar'
+
+    def __init__(self, events=(), n_buckets=2, width=1.0):
+        self.size = 0
+        self.last_time = 0.0
+        self._build(n_buckets, width, [])
+        for event in events:
+            self.push(event)
+
+    def __reduce__(self):
+        return type(self), ([e for bucket in self.buckets for e in bucket],
+                            self.n_buckets, self.width)
+
+    def __len__(self):
+        return self.size
+
+    def _build(self, n_buckets: int, width: float, events):
+        """Новое кольцо корзин с перераспределением событий"""
+        self.n_buckets = n_buckets
+        self.width = width
+        self.buckets = [[] for _ in range(n_buckets)]
+        for event in events:
+            bisect.insort(self.buckets[int(event[0] / width) % n_buckets], event)
+        # Текущая виртуальная корзина: номер без взятия остатка по n_buckets
+        self.current = int(self.last_time / width)
+        self.upper = n_buckets * 2
+        self.lower = n_buckets // 2 - 2
+
+    def _resize(self, n_buckets: int):
+        """Изменение числа корзин с новой оценкой ширины"""
+        events = [e for bucket in self.buckets for e in bucket]
+        times = sorted(e[0] for e in events)[:25]
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        width = 3.0 * sum(gaps) / len(gaps) if gaps else self.width
+        self._build(max(n_buckets, 2), width, events)
+
+    def push(self, event):
+        bisect.insort(self.buckets[int(event[0] / self.width) % self.n_buckets], event)
+        self.size += 1
+        if self.size > self.upper:
+            self._resize(self.n_buckets * 2)
+
+    def _locate(self) -> tuple:
+        """Корзина с ближайшим событием и ее виртуальный номер"""
+        if not self.size:
+            raise IndexError('pop from empty event list')
+        buckets, n, width = self.buckets, self.n_buckets, self.width
+        for position in range(self.current, self.current + n):
+            bucket = buckets[position % n]
+            if bucket and int(bucket[0][0] / width) <= position:
+                return bucket, position
+        # Ближайшее событие дальше полного оборота - прямой поиск минимума
+        event = min(bucket[0] for bucket in buckets if bucket)
+        position = int(event[0] / width)
+        return buckets[position % n], position
+
+    def popmin(self):
+        # Текущая корзина сдвигается только при извлечении: peek() не должен
+        # пропускать события, запланированные раньше найденного
+        bucket, self.current = self._locate()
+        event = bucket.pop(0)
+        self.size -= 1
+        self.last_time = event[0]
+        if self.size < self.lower:
+            self._resize(self.n_buckets // 2)
+        return event
+
+    def peek(self):
+        return self._locate()[0][0]
+
+    def discard(self, event):
+        self.buckets[int(event[0] / self.width) % self.n_buckets].remove(event)
+        self.size -= 1
+
+
+class LadderQueue:
+    """Лестничная очередь (Tang, Goh, Thng): верх, ступени корзин и низ
+
+    Новые далекие события добавляются в неупорядоченный верх. Когда низ
+    пустеет, верх раскладывается на ступень корзин; корзина, в которой больше
+    threshold событий, раскладывается на следующую ступень, остальные
+    сортируются в низ. Сортируются только небольшие группы ближайших событий.
+    """
+
+    name = 'ladder'
+
+    def __init__(self, events=(), threshold=50, max_rungs=8):
+        self.threshold = threshold
+        self.max_rungs = max_rungs
+        self.top = []
+        self.top_start = -math.inf       # События не раньше top_start идут в верх
+        self.rungs = []                  # [начало, ширина, корзины, текущая корзина]
+        self.bottom = []                 # Упорядоченный низ
+        self.size = 0
+        for event in events:
+            self.push(event)
+
+    def __reduce__(self):
+        return type(self), (self._events(), self.threshold, self.max_rungs)
+
+    def __len__(self):
+        return self.size
+
+    def _events(self) -> list:
+        events = self.top + self.bottom
+        for rung in self.rungs:
+            for bucket in rung[2][rung[3]:]:
+                events += bucket
+        return events
+
+    def push(self, event):
+        self.size += 1
+        t = event[0]
+        if t >= self.top_start:
+            self.top.append(event)
+            return
+        for rung in self.rungs:
+            start, width, buckets, current = rung
+            if t >= start + current * width:
+                index = min(max(int((t - start) / width), current), len(buckets) - 1)
+                buckets[index].append(event)
+                return
+        bisect.insort(self.bottom, event)
+
+    def _spawn(self, events, start: float, width: float):
+        """Ступень из len(events) + 1 корзин, начиная с момента start"""
+        buckets = [[] for _ in range(len(events) + 1)]
+        last = len(buckets) - 1
+        for event in events:
+            buckets[min(int((event[0] - start) / width), last)].append(event)
+        self.rungs.append([start, width, buckets, 0])
+
+    def _refill(self):
+        """Заполнение пустого низа ближайшими событиями"""
+        while not self.bottom:
+            if not self.rungs:
+                if not self.top:
+                    raise IndexError('pop from empty event list')
+                top, self.top = self.top, []
+                low = min(e[0] for e in top)
+                high = max(e[0] for e in top)
+                self.top_start = high
+                if high > low:
+                    self._spawn(top, low, (high - low) / len(top))
+                else:
+                    self.bottom = sorted(top)
+                continue
+
+            rung = self.rungs[-1]
+            start, width, buckets, current = rung
+            while current < len(buckets) and not buckets[current]:
+                current += 1
+            if current == len(buckets):
+                self.rungs.pop()
+                continue
+            bucket, buckets[current] = buckets[current], []
+            rung[3] = current + 1
+            low = start + current * width
+            if (len(bucket) > self.threshold and len(self.rungs) < self.max_rungs
+                    and max(e[0] for e in bucket) > min(e[0] for e in bucket)):
+                self._spawn(bucket, low, width / len(bucket))
+            else:
+                bucket.sort()
+                self.bottom = bucket
+
+    def popmin(self):
+        if not self.bottom:
+            self._refill()
+        self.size -= 1
+        return self.bottom.pop(0)
+
+    def peek(self):
+        if not self.bottom:
+            self._refill()
+        return self.bottom[0]
+
+    def discard(self, event):
+        for place in [self.top, self.bottom] + [b for rung in self.rungs for b in rung[2]]:
+            if event in place:
+                place.remove(event)
+                self.size -= 1
+                return
+        raise ValueError('event not in event list')
+
+
+EVENT_LISTS = {cls.name: cls for cls in (HeapEventList, CalendarQueue, LadderQueue)}
+
+# Результаты select_event_list() по числу ожидающих событий
+_EVENT_LIST_CHOICE = {}
+
+
+def benchmark_event_lists(n_pending: int, n_operations=20000, seed=0) -> Dict[str, float]:
+    """Время (сек) модели удержания для каждой реализации календаря
+
+    В календаре поддерживается n_pending событий: каждое извлечение
+    сопровождается планированием нового события через случайный интервал,
+    как в цикле моделирования.
+    """
+    rng = random.Random(seed)
+    initial = [(rng.random() * n_pending, i, 0, None) for i in range(n_pending)]
+    increments = [rng.expovariate(1.0) * n_pending for _ in range(n_operations)]
+    timings = {}
+    for name, cls in EVENT_LISTS.items():
+        events = cls(initial)
+        push, popmin = events.push, events.popmin
+        seq = count(n_pending)
+        start = time.perf_counter()
+        for increment in increments:
+            now = popmin()[0]
+            push((now + increment, next(seq), 0, None))
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def select_event_list(n_pending: int) -> str:
+    """Самая быстрая реализация календаря для n_pending ожидающих событий
+
+    Измерение выполняется один раз для каждой степени двойки n_pending.
+    """
+    size = 1 << max(n_pending - 1, 0).bit_length()
+    if size not in _EVENT_LIST_CHOICE:
+        timings = benchmark_event_lists(size)
+        _EVENT_LIST_CHOICE[size] = min(timings, key=timings.get)
+    return _EVENT_LIST_CHOICE[size]
+
+
+def make_event_list(kind=None, n_pending=1):
+    """Календарь событий: имя реализации, 'auto' (select_event_list) или готовый объект"""
+    if kind is None:
+        kind = 'heap'
+    if kind == 'auto':
+        kind = select_event_list(n_pending)
+    if isinstance(kind, str):
+        if kind not in EVENT_LISTS:
+            raise ValueError(f"Неизвестный календарь событий: {kind}")
+        return EVENT_LISTS[kind]()
+    return kind
 
-        # Создание приборов
-        self.devices = {
-            # Источник заявок (виртуальный прибор)
-            'SOURCE': Device('SOURCE', gen_interarrival),
 
+# ============================================================================
+# ТОПОЛОГИЯ СЕТИ
+# ============================================================================
+
+def build_topology(improved=False) -> Dict:
+    """Описание сети обслуживания варианта 18 в виде данных
+
+    Узлы перечислены в порядке следования заявок. Поля узла:
+      queue   - имя учитываемой очереди перед узлом (None - внутренняя очередь узла)
+      servers - число параллельных приборов
+      service - закон времени обслуживания: ('const', T) или ('uniform', A, B, поток),
+                где T, A, B - имена параметров Config, поток - имя из VARIATE_STREAMS
+      next    - следующий узел; None - выход из системы;
+                ('split', P, поток, (узел, маршрут), (узел, маршрут)) - ветвление с вероятностью P
+    """
+    return {
+        'source': {
+            'service': ('uniform', 'GEN_MIN', 'GEN_MAX', 'arrival'),
+            'next': 'EV1_PRIMARY',
+        },
+        'stations': [
             # ЭВМ1: Первичная обработка
-            'EV1_PRIMARY': Device('EV1_PRIMARY', lambda: Config.PRIM_TIME),
+            {'name': 'EV1_PRIMARY', 'queue': 'Q1', 'servers': 1,
+             'service': ('const', 'PRIM_TIME'),
+             'next': ('split', 'P_LOCAL', 'routing', ('EV1_FINAL', 'local'), ('CHANNEL', 'remote'))},
 
             # ЭВМ1: Окончательная обработка
-            'EV1_FINAL': Device('EV1_FINAL', gen_answer_time,
-                                max_parallel=2 if self.improved else 1),
+            {'name': 'EV1_FINAL', 'queue': 'Q2', 'servers': 2 if improved else 1,
+             'service': ('uniform', 'ANS_MIN', 'ANS_MAX', 'ev1_answer'),
+             'next': None},
 
             # Канал связи
-            'CHANNEL': Device('CHANNEL', lambda: Config.TRANS_TIME),
+            {'name': 'CHANNEL', 'queue': None, 'servers': 1,
+             'service': ('const', 'TRANS_TIME'),
+             'next': 'EV2_PRIMARY'},
 
             # ЭВМ2: Первичная обработка
-            'EV2_PRIMARY': Device('EV2_PRIMARY', lambda: Config.PRIM_TIME),
+            {'name': 'EV2_PRIMARY', 'queue': 'Q3', 'servers': 1,
+             'service': ('const', 'PRIM_TIME'),
+             'next': 'EV2_FINAL'},
 
             # ЭВМ2: Окончательная обработка
-            'EV2_FINAL': Device('EV2_FINAL', gen_answer_time),
-        }
+            {'name': 'EV2_FINAL', 'queue': None, 'servers': 1,
+             'service': ('uniform', 'ANS_MIN', 'ANS_MAX', 'ev2_answer'),
+             'next': None},
+        ],
+    }
 
-        # Специальные очереди (отдельно от приборов)
-        self.queues = {
-            'Q1': deque(),  # Очередь перед EV1_PRIMARY
-            'Q2': deque(),  # Очередь перед EV1_FINAL
-            'Q3': deque(),  # Очередь перед EV2_PRIMARY
-        }
 
-        # История для очередей
-        self.queue_history = {name: [] for name in self.queues.keys()}
+# ============================================================================
+# КЛАСС МОДЕЛИ
+# ============================================================================
 
-    def _schedule_event(self, event: Event):
-        """Добавить событие в календарь"""
-        heapq.heappush(self.event_list, event)
-
-    def _collect_queue_stats(self):
-        """Сбор статистики по очередям"""
-        for q_name, q in self.queues.items():
-            q_len = len(q)
-            self.stats['queue_lengths'][q_name].append((self.current_time, q_len))
-
-            # Обновление максимальной длины
-            if q_len > self.stats['queue_max'][q_name]:
-                self.stats['queue_max'][q_name] = q_len
-
-            # Обновление средней длины (скользящее среднее)
-            prev_avg = self.stats['queue_avg'][q_name]
-            prev_samples = self.stats['queue_samples'][q_name]
-            new_avg = (prev_avg * prev_samples + q_len) / (prev_samples + 1)
-            self.stats['queue_avg'][q_name] = new_avg
-            self.stats['queue_samples'][q_name] += 1
-
-    def _arrival_event(self):
-        """Обработка события прибытия новой заявки"""
-        # Создание новой заявки
-        request = Request(self.current_time)
-        self.active_requests.append(request)
-        self.request_counter += 1
-
-        # Добавление в очередь Q1
-        if self.max_queue_size and len(self.queues['Q1']) >= self.max_queue_size:
-            self.lost_requests += 1
-            print(f"  [WARN] Заявка {request.id} потеряна (очередь Q1 переполнена)")
-        else:
-            self.queues['Q1'].append((self.current_time, request))
-            self._collect_queue_stats()
-
-            # Попытка начать обработку на EV1_PRIMARY
-            self._try_start_ev1_primary()
-
-        # Планирование следующего прибытия
-        if self.request_counter < Config.TOTAL_REQUESTS:
-            interarrival = self.devices['SOURCE'].service_time_func()
-            next_arrival = self.current_time + interarrival
-            self._schedule_event(Event(next_arrival, 'ARRIVAL'))
-
-    def _try_start_ev1_primary(self):
-        """Попытка начать обработку на EV1_PRIMARY"""
-        if self.queues['Q1'] and self.devices['EV1_PRIMARY'].is_available():
-            # Извлечение заявки из очереди
-            arrival_time, request = self.queues['Q1'].popleft()
-            wait_time = self.current_time - arrival_time
-            request.queue_times['Q1'] = wait_time
-            self.stats['wait_times']['Q1'].append(wait_time)
-            self._collect_queue_stats()
-
-            # Начало обслуживания
-            service_time = Config.PRIM_TIME
-            end_time = self.current_time + service_time
-
-            # Запись в историю прибора
-            self.devices['EV1_PRIMARY'].history.append(
-                (self.current_time, 'start', request.id, service_time)
-            )
-            self.devices['EV1_PRIMARY'].parallel_count += 1
-
-            # Планирование окончания обработки
-            self._schedule_event(Event(end_time, 'EV1_PRIMARY_END', request))
-
-    def _ev1_primary_end_event(self, request: Request):
-        """Обработка окончания первичной обработки на ЭВМ1"""
-        # Освобождение прибора
-        self.devices['EV1_PRIMARY'].parallel_count -= 1
-        self.devices['EV1_PRIMARY'].total_processed += 1
-        self.devices['EV1_PRIMARY'].busy_time += Config.PRIM_TIME
-        self.devices['EV1_PRIMARY'].history.append(
-            (self.current_time, 'finish', request.id)
-        )
+def _describe(values: np.ndarray) -> Dict:
+    """Минимум, максимум и среднее массива (нули для пустого массива)"""
+    if not values.size:
+        return {'min': 0, 'max': 0, 'avg': 0}
+    return {'min': float(values.min()), 'max': float(values.max()), 'avg': float(values.mean())}
 
-        # Определение маршрута
-        if random.random() < Config.P_LOCAL:
-            request.path = 'local'
-            # Добавление в очередь Q2
-            self.queues['Q2'].append((self.current_time, request))
-            self._collect_queue_stats()
-            self._try_start_ev1_final()
-        else:
-            request.path = 'remote'
-            # Добавление в очередь канала
-            if self.devices['CHANNEL'].is_available():
-                self._start_channel_transfer(request)
-            else:
-                self.devices['CHANNEL'].add_to_queue(request, self.current_time)
-
-        # Попытка начать обработку следующей заявки из Q1
-        self._try_start_ev1_primary()
-
-    def _try_start_ev1_final(self):
-        """Попытка начать окончательную обработку на ЭВМ1"""
-        if self.queues['Q2'] and self.devices['EV1_FINAL'].is_available():
-            # Извлечение заявки из очереди
-            arrival_time, request = self.queues['Q2'].popleft()
-            wait_time = self.current_time - arrival_time
-            request.queue_times['Q2'] = wait_time
-            self.stats['wait_times']['Q2'].append(wait_time)
-            self._collect_queue_stats()
-
-            # Начало обслуживания
-            service_time = random.uniform(Config.ANS_MIN, Config.ANS_MAX)
-            end_time = self.current_time + service_time
-
-            # Запись в историю прибора
-            self.devices['EV1_FINAL'].history.append(
-                (self.current_time, 'start', request.id, service_time)
-            )
-            self.devices['EV1_FINAL'].parallel_count += 1
-
-            # Планирование окончания обработки
-            self._schedule_event(Event(end_time, 'EV1_FINAL_END', request))
-
-    def _start_channel_transfer(self, request: Request):
-        """Начать передачу по каналу"""
-        service_time = Config.TRANS_TIME
-        end_time = self.current_time + service_time
-
-        self.devices['CHANNEL'].history.append(
-            (self.current_time, 'start', request.id, service_time)
-        )
-        self.devices['CHANNEL'].parallel_count += 1
-
-        self._schedule_event(Event(end_time, 'CHANNEL_END', request))
-
-    def _channel_end_event(self, request: Request):
-        """Обработка окончания передачи по каналу"""
-        # Освобождение канала
-        self.devices['CHANNEL'].parallel_count -= 1
-        self.devices['CHANNEL'].total_processed += 1
-        self.devices['CHANNEL'].busy_time += Config.TRANS_TIME
-        self.devices['CHANNEL'].history.append(
-            (self.current_time, 'finish', request.id)
-        )
 
-        # Проверка очереди канала
-        if self.devices['CHANNEL'].queue:
-            next_request, _ = self.devices['CHANNEL'].get_from_queue(self.current_time)
-            self._start_channel_transfer(next_request)
-
-        # Добавление заявки в очередь Q3
-        self.queues['Q3'].append((self.current_time, request))
-        self._collect_queue_stats()
-        self._try_start_ev2_primary()
-
-    def _try_start_ev2_primary(self):
-        """Попытка начать обработку на ЭВМ2 (первичная)"""
-        if self.queues['Q3'] and self.devices['EV2_PRIMARY'].is_available():
-            # Извлечение заявки из очереди
-            arrival_time, request = self.queues['Q3'].popleft()
-            wait_time = self.current_time - arrival_time
-            request.queue_times['Q3'] = wait_time
-            self.stats['wait_times']['Q3'].append(wait_time)
-            self._collect_queue_stats()
-
-            # Начало обслуживания
-            service_time = Config.PRIM_TIME
-            end_time = self.current_time + service_time
-
-            # Запись в историю прибора
-            self.devices['EV2_PRIMARY'].history.append(
-                (self.current_time, 'start', request.id, service_time)
-            )
-            self.devices['EV2_PRIMARY'].parallel_count += 1
-
-            # Планирование окончания обработки
-            self._schedule_event(Event(end_time, 'EV2_PRIMARY_END', request))
-
-    def _ev2_primary_end_event(self, request: Request):
-        """Обработка окончания первичной обработки на ЭВМ2"""
-        # Освобождение прибора
-        self.devices['EV2_PRIMARY'].parallel_count -= 1
-        self.devices['EV2_PRIMARY'].total_processed += 1
-        self.devices['EV2_PRIMARY'].busy_time += Config.PRIM_TIME
-        self.devices['EV2_PRIMARY'].history.append(
-            (self.current_time, 'finish', request.id)
-        )
+# Номер обработчика события прибытия; обработчики окончания обслуживания
+# получают номера 1..N в порядке узлов топологии
+ARRIVAL_SLOT = 0
 
-        # Начало окончательной обработки на ЭВМ2
-        if self.devices['EV2_FINAL'].is_available():
-            self._start_ev2_final(request)
-        else:
-            self.devices['EV2_FINAL'].add_to_queue(request, self.current_time)
 
-        # Попытка начать обработку следующей заявки из Q3
-        self._try_start_ev2_primary()
+class _Halt(Exception):
+    """Остановка цикла событий событием-ограничителем run_until()"""
 
-    def _start_ev2_final(self, request: Request):
-        """Начать окончательную обработку на ЭВМ2"""
-        service_time = random.uniform(Config.ANS_MIN, Config.ANS_MAX)
-        end_time = self.current_time + service_time
 
-        self.devices['EV2_FINAL'].history.append(
-            (self.current_time, 'start', request.id, service_time)
-        )
-        self.devices['EV2_FINAL'].parallel_count += 1
+class DistributedDBModel:
+    """Основной класс имитационной модели распределенного банка данных
+
+    События хранятся в календаре как кортежи (время, порядковый номер, слот, id заявки);
+    слот - индекс обработчика в таблице self._handlers, построенной по топологии.
+    event_list - реализация календаря ('heap', 'calendar', 'ladder', 'auto' или
+    объект с интерфейсом календаря), по умолчанию двоичная куча.
+    """
+
+    def __init__(self, improved_system=False, max_queue_size=None,
+                 recording=None, history_size=None, queue_series_points=None, rng=None,
+                 variates=None, queue_bin_width=None, trace=None, profiler=None, config=None,
+                 event_list=None):
+        # Параметры системы (config - ModelConfig; по умолчанию текущие значения Config)
+        self.config = config if config is not None else ModelConfig.from_defaults()
+        self.improved = improved_system
+        self.max_queue_size = max_queue_size
 
-        self._schedule_event(Event(end_time, 'EV2_FINAL_END', request))
+        # Источник случайных величин: variates, генератор rng (rng=random - общий
+        # глобальный генератор, как в исходной модели) или собственный генератор
+        # экземпляра, начальное значение которого берется из модуля random
+        # (поэтому random.seed() перед созданием моделей сохраняет воспроизводимость)
+        if variates is None:
+            variates = RandomVariates(rng if rng is not None
+                                      else random.Random(random.getrandbits(64)))
+        self.variates = variates
+        self.recording = recording or self.config.RECORDING
+        self.history_size = history_size or self.config.HISTORY_SIZE
+        self.queue_series_points = (self.config.QUEUE_SERIES_POINTS if queue_series_points is None
+                                    else queue_series_points)
+        self.queue_bin_width = queue_bin_width  # Интервал усреднения длин очередей (None - нет)
+
+        # Трасса событий на диске (каталог или TraceWriter; None - не записывать)
+        self.trace = TraceWriter(trace) if isinstance(trace, str) else trace
+        self.profiler = profiler  # Профилировщик обработчиков (None - не подключен)
 
-    def _ev1_final_end_event(self, request: Request):
-        """Обработка окончания на ЭВМ1 (завершение обслуживания)"""
-        # Освобождение прибора
-        self.devices['EV1_FINAL'].parallel_count -= 1
-        self.devices['EV1_FINAL'].total_processed += 1
+        # Временные переменные
+        self.current_time = 0.0
+        self.event_list = None  # Календарь событий (создается по топологии)
+        self._started = False
+        self._seq_start = 0   # Начальный порядковый номер событий (после контрольной точки)
 
-        # Расчет времени обслуживания
-        start_event = next((h for h in self.devices['EV1_FINAL'].history
-                            if h[1] == 'start' and h[2] == request.id), None)
-        if start_event:
-            service_time = start_event[3]
-            self.devices['EV1_FINAL'].busy_time += service_time
+        # Счетчики
+        self.request_counter = 0
+        self.processed_requests = 0
+        self.lost_requests = 0
 
-        self.devices['EV1_FINAL'].history.append(
-            (self.current_time, 'finish', request.id)
-        )
+        # Статистика (поля заявок хранятся в self.requests)
+        self.stats = {
+            'events_processed': 0,                # Количество обработанных событий
+        }
 
-        # Завершение обслуживания заявки
-        request.finish_time = self.current_time
-        self.finished_requests.append(request)
-        self.active_requests.remove(request)
-        self.processed_requests += 1
-
-        # Сбор статистики по времени
-        total_time = request.total_time()
-        self.stats['system_times'].append(total_time)
-
-        # Попытка начать обработку следующей заявки из Q2
-        self._try_start_ev1_final()
-
-        # Проверка очереди прибора EV1_FINAL
-        if self.devices['EV1_FINAL'].queue:
-            next_request, _ = self.devices['EV1_FINAL'].get_from_queue(self.current_time)
-            self._start_ev2_final(next_request)
-
-    def _ev2_final_end_event(self, request: Request):
-        """Обработка окончания на ЭВМ2 (завершение обслуживания)"""
-        # Освобождение прибора
-        self.devices['EV2_FINAL'].parallel_count -= 1
-        self.devices['EV2_FINAL'].total_processed += 1
-
-        # Расчет времени обслуживания
-        start_event = next((h for h in self.devices['EV2_FINAL'].history
-                            if h[1] == 'start' and h[2] == request.id), None)
-        if start_event:
-            service_time = start_event[3]
-            self.devices['EV2_FINAL'].busy_time += service_time
-
-        self.devices['EV2_FINAL'].history.append(
-            (self.current_time, 'finish', request.id)
-        )
+        # Инициализация приборов и таблицы обработчиков; в календаре не больше
+        # одного прибытия и по событию на каждый прибор
+        self._init_devices()
+        self.event_list = make_event_list(
+            event_list, 1 + sum(spec['servers'] for spec in self.topology['stations']))
+        self._build_kernel()
+
+    def _make_service(self, spec):
+        """Функция генерации времени и константа для описания закона обслуживания"""
+        kind = spec[0]
+        if kind == 'const':
+            value = getattr(self.config, spec[1])
+            return (lambda: value), value
+        if kind == 'uniform':
+            return self.variates.uniform(spec[3], getattr(self.config, spec[1]),
+                                         getattr(self.config, spec[2])), None
+        raise ValueError(f"Неизвестный закон обслуживания: {kind}")
 
-        # Завершение обслуживания заявки
-        request.finish_time = self.current_time
-        self.finished_requests.append(request)
-        self.active_requests.remove(request)
-        self.processed_requests += 1
+    def _init_devices(self):
+        """Инициализация всех приборов системы по описанию топологии"""
+        self.topology = build_topology(self.improved)
+
+        # Источник заявок (виртуальный прибор)
+        func, const = self._make_service(self.topology['source']['service'])
+        self.devices = {'SOURCE': Device('SOURCE', func, service_const=const)}
+
+        for spec in self.topology['stations']:
+            func, const = self._make_service(spec['service'])
+            self.devices[spec['name']] = Device(spec['name'], func,
+                                                max_parallel=spec['servers'],
+                                                service_const=const,
+                                                queue_name=spec['queue'],
+                                                recording=self.recording,
+                                                history_size=self.history_size)
+
+        # Учитываемые очереди (общие объекты с очередями узлов) и их статистика
+        self.queues = {dev.queue_name: dev.queue
+                       for dev in self.devices.values() if dev.queue_name}
+        if self.queue_bin_width:
+            self.queue_stats = {name: BinnedQueueStats(name, self.queue_series_points,
+                                                       self.queue_bin_width)
+                                for name in self.queues}
+        else:
+            self.queue_stats = {name: QueueStats(name, self.queue_series_points)
+                                for name in self.queues}
+
+        # Хранилище заявок: столбец ожиданий на каждый узел, коды маршрутов из ветвлений
+        path_labels = []
+        for spec in self.topology['stations']:
+            if isinstance(spec['next'], tuple):
+                path_labels += [spec['next'][3][1], spec['next'][4][1]]
+        self.requests = RequestStore(
+            [spec['queue'] or spec['name'] for spec in self.topology['stations']],
+            path_labels, capacity=self.config.TOTAL_REQUESTS)
+
+    def _build_kernel(self):
+        """Построение таблицы обработчиков событий по топологии"""
+        push = self.event_list.push
+        seq = self._seq = count(self._seq_start)
+        store = self.requests
+        stations = [self.devices[spec['name']] for spec in self.topology['stations']]
+        slots = {dev.name: ARRIVAL_SLOT + 1 + i for i, dev in enumerate(stations)}
+        entry_name = self.topology['source']['next']
+        flush_size = QueueStats.flush_size
+
+        # Трассировка: номер узла в трассе - позиция в self.devices (0 - источник)
+        trace = self.trace
+        if trace is not None:
+            trace.open(list(self.devices), list(self.queues), list(self.queues.values()))
+            record = trace.record
+            trace_codes = {name: i for i, name in enumerate(self.devices)}
+
+        def make_start(dev):
+            """Начало обслуживания заявки на приборе узла"""
+            slot = slots[dev.name]
+            const = dev.service_const
+            func = dev.service_time_func
+            in_service = dev.in_service
+            summary = dev.recording != 'off'
+            history = dev.history
+            is_entry = dev.name == entry_name
+            traced = trace is not None
+            code = trace_codes[dev.name] if traced else 0
+            extra = history is not None or traced   # Запись истории или трассы
+
+            def start(now, rid):
+                service_time = const if const is not None else func()
+                in_service[rid] = (now, service_time)
+                dev.parallel_count += 1
+                if is_entry:
+                    store.start[rid] = now
+                if summary:
+                    dev.total_started += 1
+                    dev.service_time_sum += service_time
+                    dev.service_time_sq_sum += service_time * service_time
+                    if dev.parallel_count > dev.peak_parallel:
+                        dev.peak_parallel = dev.parallel_count
+                if extra:
+                    if history is not None:
+                        history.append((now, 'start', rid, service_time))
+                    if traced:
+                        record(now, TRACE_START, code, rid)
+                push((now + service_time, next(seq), slot, rid))
+            return start
+
+        def make_pull(dev, start):
+            """Извлечение следующей заявки из очереди узла при свободном приборе"""
+            queue = dev.queue
+            column = store.queue_index[dev.queue_name or dev.name]
+            q_stats = self.queue_stats.get(dev.queue_name)
+            log = q_stats.pending if q_stats is not None else None
+
+            def pull(now):
+                if queue and dev.parallel_count < dev.max_parallel:
+                    arrival_time, rid = queue.popleft()
+                    store.waits[rid, column] = now - arrival_time
+                    if log is not None:
+                        log.append((now, len(queue)))
+                        if len(log) >= flush_size:
+                            q_stats.flush()
+                    start(now, rid)
+            return pull
+
+        def make_enter(dev, start, pull):
+            """Поступление заявки в узел"""
+            queue = dev.queue
+
+            if dev.queue_name is not None:
+                q_stats = self.queue_stats[dev.queue_name]
+                log = q_stats.pending
+
+                # Изменения длины учитываются в QueueStats.flush() блоками
+                def enter(now, rid):
+                    if not queue and dev.parallel_count < dev.max_parallel:
+                        # Заявка проходит пустой накопитель без ожидания (длина 1 и
+                        # сразу 0, время ожидания в хранилище остается нулевым)
+                        log.append((now, 1))
+                        log.append((now, 0))
+                        if len(log) >= flush_size:
+                            q_stats.flush()
+                        start(now, rid)
+                        return
+                    queue.append((now, rid))
+                    log.append((now, len(queue)))
+                    if len(log) >= flush_size:
+                        q_stats.flush()
+                    if dev.parallel_count < dev.max_parallel:
+                        pull(now)
+            else:
+                def enter(now, rid):
+                    if dev.parallel_count < dev.max_parallel:
+                        start(now, rid)
+                    else:
+                        queue.append((now, rid))
+            return enter
+
+        starts, pulls, enters = {}, {}, {}
+        for dev in stations:
+            starts[dev.name] = make_start(dev)
+            pulls[dev.name] = make_pull(dev, starts[dev.name])
+            enters[dev.name] = make_enter(dev, starts[dev.name], pulls[dev.name])
+
+        def finish(now, rid):
+            """Выход заявки из системы"""
+            store.finish_request(rid, now)
+            self.processed_requests += 1
+
+        def make_route(target):
+            """Передача заявки следующему узлу (или выход из системы)"""
+            if target is None:
+                return finish
+            if isinstance(target, str):
+                return enters[target]
+
+            _, p_name, stream, (name_a, path_a), (name_b, path_b) = target
+            p = getattr(self.config, p_name)
+            uniform01 = self.variates.uniform01(stream)
+            enter_a, enter_b = enters[name_a], enters[name_b]
+            code_a, code_b = store.path_code(path_a), store.path_code(path_b)
+
+            def route(now, rid):
+                if uniform01() < p:
+                    store.path[rid] = code_a
+                    enter_a(now, rid)
+                else:
+                    store.path[rid] = code_b
+                    enter_b(now, rid)
+            return route
+
+        def make_end(dev, route, pull):
+            """Окончание обслуживания заявки на приборе узла"""
+            in_service = dev.in_service
+            history = dev.history
+            queue = dev.queue
+            traced = trace is not None
+            code = trace_codes[dev.name] if traced else 0
+            extra = history is not None or traced
+
+            def end(now, rid):
+                dev.parallel_count -= 1
+                dev.total_processed += 1
+
+                # Время обслуживания берется из записи о начале обслуживания
+                _, service_time = in_service.pop(rid)
+                dev.busy_time += service_time
+                if extra:
+                    if history is not None:
+                        history.append((now, 'finish', rid))
+                    if traced:
+                        record(now, TRACE_FINISH, code, rid)
+
+                route(now, rid)
+                if queue:
+                    pull(now)
+            return end
+
+        enter_system = enters[entry_name]
+        entry_queue = self.devices[entry_name].queue
+        max_queue_size = self.max_queue_size
+        total_requests = self.config.TOTAL_REQUESTS
+        interarrival = self.devices['SOURCE'].service_time_func
+        traced = trace is not None
+
+        def arrival(now, _data=None):
+            """Прибытие новой заявки и планирование следующего прибытия"""
+            rid = store.add(now)
+            self.request_counter += 1
+
+            # Добавление в очередь первого узла
+            if max_queue_size and len(entry_queue) >= max_queue_size:
+                self.lost_requests += 1
+                if traced:
+                    record(now, TRACE_LOST, 0, rid)
+            else:
+                if traced:
+                    record(now, TRACE_ARRIVAL, 0, rid)
+                enter_system(now, rid)
 
-        # Сбор статистики по времени
-        total_time = request.total_time()
-        self.stats['system_times'].append(total_time)
+            if self.request_counter < total_requests:
+                push((now + interarrival(), next(seq), ARRIVAL_SLOT, None))
 
-        # Проверка очереди прибора EV2_FINAL
-        if self.devices['EV2_FINAL'].queue:
-            next_request, _ = self.devices['EV2_FINAL'].get_from_queue(self.current_time)
-            self._start_ev2_final(next_request)
+        self._handlers = [None] * (len(stations) + 1)
+        self._handlers[ARRIVAL_SLOT] = arrival
+        for dev, spec in zip(stations, self.topology['stations']):
+            route = make_route(spec['next'])
+            self._handlers[slots[dev.name]] = make_end(dev, route, pulls[dev.name])
 
-    def run(self, verbose=False):
-        """Основной цикл моделирования"""
-        print(f"{'='*60}")
-        print(f"Запуск имитационной модели распределенного банка данных")
-        print(f"{'='*60}")
-        print(f"Параметры системы:")
-        print(f"  - Всего заявок: {Config.TOTAL_REQUESTS}")
-        print(f"  - Улучшенная система: {'ДА' if self.improved else 'НЕТ'}")
-        print(f"  - Макс. размер очереди: {self.max_queue_size or 'не ограничен'}")
-        print(f"{'='*60}")
+
+        if self.profiler is not None:
+            self.profiler.attach(self)
+
+        # Событие-ограничитель модельного времени (не профилируется)
+        self._halt_slot = len(self._handlers)
+        self._handlers.append(self._halt)
+
+    def _halt(self, now, _data=None):
+        raise _Halt
+
+    def _schedule_event(self, time: float, slot: int, data=None):
+        """Добавить событие в календарь"""
+        self.event_list.push((time, next(self._seq), slot, data))
+
+    def _finalize_queue_stats(self):
+        """Учет длин очередей до конца модельного времени"""
+        for name, q_stats in self.queue_stats.items():
+            q_stats.update(self.current_time, len(self.queues[name]))
+            q_stats.flush()
+
+    # Атрибуты, которые не сохраняются в контрольной точке и строятся заново
+    _TRANSIENT = ('_handlers', '_seq', 'profiler')
+
+    def _variate_counts(self) -> Dict[str, int]:
+        """Количество чисел, выданных каждым потоком случайных величин к текущему моменту"""
+        counts = defaultdict(int)
+        source = self.topology['source']['service']
+        if source[0] == 'uniform' and self._started:
+            counts[source[3]] += 1 + min(self.request_counter, self.config.TOTAL_REQUESTS - 1)
+        for spec in self.topology['stations']:
+            dev = self.devices[spec['name']]
+            if spec['service'][0] == 'uniform':
+                counts[spec['service'][3]] += dev.total_processed + len(dev.in_service)
+            if isinstance(spec['next'], tuple):
+                counts[spec['next'][2]] += dev.total_processed
+        return dict(counts)
+
+    def __getstate__(self):
+        state = {key: value for key, value in self.__dict__.items() if key not in self._TRANSIENT}
+        # Следующий номер события; пропуск одного номера не меняет порядок событий
+        state['_seq_start'] = next(self._seq)
+        state['_variate_counts'] = self._variate_counts()
+        return state
+
+    def __setstate__(self, state):
+        counts = state.pop('_variate_counts')
+        self.__dict__.update(state)
+        self.profiler = None
+
+        # Потоки случайных величин продолжаются с сохраненной позиции
+        self.variates.resume_at(counts)
+        specs = [self.topology['source']] + self.topology['stations']
+        for name, spec in zip(['SOURCE'] + [s['name'] for s in self.topology['stations']], specs):
+            self.devices[name].service_time_func = self._make_service(spec['service'])[0]
+        self._build_kernel()
+
+    def checkpoint(self, path: str):
+        """Сохранение полного состояния модели в файл (атомарно, со сжатием)"""
+        data = zlib.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> 'DistributedDBModel':
+        """Модель, восстановленная из контрольной точки"""
+        with open(path, 'rb') as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+    def _start(self):
+        """Планирование первого события прибытия (один раз за время жизни модели)"""
+        if self._started:
+            return
+        self._started = True
+        first_arrival = self.devices['SOURCE'].service_time_func()
+        self._schedule_event(first_arrival, ARRIVAL_SLOT)
+
+    @property
+    def finished(self) -> bool:
+        """Моделирование завершено: обработаны все заявки или календарь пуст"""
+        return self._started and (self.processed_requests >= self.config.TOTAL_REQUESTS
+                                  or not self.event_list)
+
+    def _advance(self, max_events=None, verbose=False, until=None) -> int:
+        """Обработка не более max_events событий (None - до завершения); число событий
+
+        until - остановка на моменте модельного времени until: события этого
+        и более поздних моментов не обрабатываются.
+        """
+        self._start()
+        calendar = self.event_list
+        halt = None
+        if until is not None:
+            if until <= self.current_time:
+                return 0
+            # Ограничитель раньше всех событий момента until (порядковый номер -1);
+            # проверка времени в цикле не нужна
+            halt = (until, -1, self._halt_slot, None)
+            calendar.push(halt)
+        if self.profiler is not None:
+            self.profiler.begin()
+
+        pop = calendar.popmin
+        handlers = self._handlers
+        total_requests = self.config.TOTAL_REQUESTS
+        limit = math.inf if max_events is None else max_events
+        done = self.stats['events_processed']
+        iteration = 0
+        try:
+            if verbose or self.profiler is not None:
+                while self.processed_requests < total_requests and calendar and iteration < limit:
+                    iteration += 1
+
+                    # Извлечение следующего события
+                    now, _, slot, data = pop()
+                    self.current_time = now
+
+                    if verbose and (done + iteration) % 50 == 0:
+                        print(f"Итерация {done + iteration}: t={now:.2f}, "
+                              f"обработано {self.processed_requests}/{total_requests}")
+
+                    # Обработка события
+                    handlers[slot](now, data)
+            else:
+                # Основной цикл: обработчики получают время аргументом, поэтому
+                # текущее время модели обновляется один раз по выходе из цикла
+                now = self.current_time
+                try:
+                    while self.processed_requests < total_requests and calendar and iteration < limit:
+                        iteration += 1
+                        now, _, slot, data = pop()
+                        handlers[slot](now, data)
+                finally:
+                    self.current_time = now
+        except _Halt:
+            iteration -= 1
+            halt = None
+        if halt is not None:
+            calendar.discard(halt)
+
+        self.stats['events_processed'] += iteration
+        if self.profiler is not None:
+            self.profiler.end()
+        if self.trace is not None and self.finished:
+            self.trace.close()
+        return iteration
+
+    def step(self, n=1) -> int:
+        """Обработка следующих n событий; число обработанных событий"""
+        return self._advance(n)
+
+    def run_until(self, model_time: float) -> int:
+        """Обработка всех событий, происходящих раньше момента model_time
+
+        Модельное время переходит на model_time (если моделирование не
+        завершилось раньше), статистика очередей учитывается до этого момента.
+        Продолжить моделирование можно любым из методов step/run_until/run.
+        """
+        events = self._advance(until=model_time)
+        self._finalize_queue_stats()
+        return events
+
+    def events(self, max_events=None):
+        """Генератор событий: (время, узел, id заявки) после обработки каждого события
+
+        Узел 'SOURCE' - прибытие новой заявки. События обрабатываются по мере
+        запроса следующего элемента.
+        """
+        names = ['SOURCE'] + [spec['name'] for spec in self.topology['stations']]
+        produced = 0
+        self._start()
+        while not self.finished and (max_events is None or produced < max_events):
+            now, _, slot, rid = self.event_list.peek()
+            self._advance(1)
+            produced += 1
+            if slot == ARRIVAL_SLOT:
+                rid = self.request_counter - 1
+            yield now, names[slot], rid
+
+    def advance_until(self, *conditions, check_every=1000):
+        """Моделирование до выполнения одного из условий остановки
+
+        Условие - функция condition(model) -> bool (например, ModelTimeLimit,
+        WallClockLimit, Converged), проверяется каждые check_every событий;
+        ограничение ModelTimeLimit соблюдается точно. Возвращает сработавшее
+        условие или None, если моделирование завершилось раньше.
+        """
+        horizon = min((c.model_time for c in conditions if isinstance(c, ModelTimeLimit)),
+                      default=None)
+        for condition in conditions:
+            if hasattr(condition, 'reset'):
+                condition.reset()
+        try:
+            while not self.finished:
+                self._advance(check_every, until=horizon)
+                for condition in conditions:
+                    if condition(self):
+                        return condition
+            return None
+        finally:
+            self._finalize_queue_stats()
+
+    def _finish(self):
+        """Финальный сбор статистики после завершения моделирования"""
+        self._finalize_queue_stats()
+        self.close()
+
+    def close(self):
+        """Сохранение трассы событий (последний блок и meta.json)
+
+        run() вызывает close() сам, step/run_until/advance_until - когда
+        моделирование завершено. Если прогон остановлен раньше (например,
+        условием advance_until), трассу сохраняет явный вызов close() или
+        выход из блока with; продолжать такой прогон с записью трассы нельзя.
+        """
+        if self.trace is not None:
+            self.trace.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, verbose=False, quiet=False, checkpoint_path=None, checkpoint_every=100000):
+        """Основной цикл моделирования (quiet - без вывода заголовка и итогов)
+
+        При заданном checkpoint_path состояние сохраняется в файл каждые
+        checkpoint_every событий; прерванный прогон продолжается функцией resume().
+        """
+        if not quiet:
+            print(f"{'='*60}")
+            print(f"Запуск имитационной модели распределенного банка данных")
+            print(f"{'='*60}")
+            print(f"Параметры системы:")
+            print(f"  - Всего заявок: {self.config.TOTAL_REQUESTS}")
+            print(f"  - Улучшенная система: {'ДА' if self.improved else 'НЕТ'}")
+            print(f"  - Макс. размер очереди: {self.max_queue_size or 'не ограничен'}")
+            print(f"{'='*60}")
 
         # Начальная инициализация
         start_time_wall = time.time()
 
-        # Планирование первого события прибытия
-        first_arrival = random.uniform(Config.GEN_MIN, Config.GEN_MAX)
-        self._schedule_event(Event(first_arrival, 'ARRIVAL'))
-
         # Основной цикл событий
-        iteration = 0
-        while self.processed_requests < Config.TOTAL_REQUESTS and self.event_list:
-            iteration += 1
-
-            # Извлечение следующего события
-            event = heapq.heappop(self.event_list)
-            self.current_time = event.time
-            self.stats['events_processed'] += 1
-
-            if verbose and iteration % 50 == 0:
-                print(f"Итерация {iteration}: t={self.current_time:.2f}, "
-                      f"обработано {self.processed_requests}/{Config.TOTAL_REQUESTS}")
-
-            # Обработка события
-            if event.event_type == 'ARRIVAL':
-                self._arrival_event()
-            elif event.event_type == 'EV1_PRIMARY_END':
-                self._ev1_primary_end_event(event.data)
-            elif event.event_type == 'EV1_FINAL_END':
-                self._ev1_final_end_event(event.data)
-            elif event.event_type == 'CHANNEL_END':
-                self._channel_end_event(event.data)
-            elif event.event_type == 'EV2_PRIMARY_END':
-                self._ev2_primary_end_event(event.data)
-            elif event.event_type == 'EV2_FINAL_END':
-                self._ev2_final_end_event(event.data)
-
-            # Периодический сбор статистики
-            if self.current_time - self.stats['last_stat_time'] > 100.0:
-                self._collect_queue_stats()
-                self.stats['last_stat_time'] = self.current_time
+        if checkpoint_path is None:
+            self._advance(verbose=verbose)
+        else:
+            while not self.finished:
+                self._advance(checkpoint_every, verbose=verbose)
+                if not self.finished:
+                    self.checkpoint(checkpoint_path)
 
         # Финальный сбор статистики
-        self._collect_queue_stats()
+        self._finish()
 
         # Расчет времени моделирования
         end_time_wall = time.time()
         simulation_time_wall = end_time_wall - start_time_wall
 
+        if quiet:
+            return
         print(f"{'='*60}")
         print(f"Моделирование завершено!")
         print(f"  - Модельное время: {self.current_time:.2f} сек")
@@ -582,22 +1943,61 @@ class DistributedDBModel:
         print(f"  - Потеряно заявок: {self.lost_requests}")
         print(f"{'='*60}")
 
+    def _input_means(self) -> Dict[str, float]:
+        """Выборочные средние входных величин по потокам (см. input_expectations)
+
+        Для интервалов поступления и времен обслуживания - среднее
+        использованных значений, для ветвления - доля первого направления.
+        Времена обслуживания известны только при уровне записи не 'off'.
+        """
+        store = self.requests
+        means = {}
+        source = self.topology['source']['service']
+        if source[0] == 'uniform' and store.size:
+            # Заявка i создана в момент суммы первых i+1 интервалов
+            means[source[3]] = float(store.creation[store.size - 1]) / store.size
+
+        sums = defaultdict(lambda: [0.0, 0])
+        for spec in self.topology['stations']:
+            dev = self.devices[spec['name']]
+            if spec['service'][0] == 'uniform' and dev.recording != 'off':
+                sums[spec['service'][3]][0] += dev.service_time_sum
+                sums[spec['service'][3]][1] += dev.total_started
+            if isinstance(spec['next'], tuple):
+                paths = store.path[:store.size]
+                routed = paths[paths >= 0]
+                if routed.size:
+                    means[spec['next'][2]] = float(np.mean(routed == store.path_code(spec['next'][3][1])))
+        for stream, (total, n) in sums.items():
+            if n:
+                means[stream] = total / n
+        return means
+
     def get_statistics(self) -> Dict:
         """Получить полную статистику по моделированию"""
-        if not self.finished_requests:
+        store = self.requests
+        if not store.n_finished:
             return {}
+        for q_stats in self.queue_stats.values():
+            q_stats.flush()
+
+        # Завершенные заявки в порядке выхода из системы
+        finished = store.finished_ids()
+        local = store.path[finished] == store.path_code('local')
+        remote = store.path[finished] == store.path_code('remote')
 
         # Времена пребывания в системе
-        system_times = [r.total_time() for r in self.finished_requests]
+        system_times = store.finish[finished] - store.creation[finished]
 
         # Времена ожидания в очередях
-        wait_times_q1 = [r.queue_times.get('Q1', 0) for r in self.finished_requests]
-        wait_times_q2 = [r.queue_times.get('Q2', 0) for r in self.finished_requests if r.path == 'local']
-        wait_times_q3 = [r.queue_times.get('Q3', 0) for r in self.finished_requests if r.path == 'remote']
+        waits = store.waits[finished]
+        wait_times_q1 = waits[:, store.queue_index['Q1']]
+        wait_times_q2 = waits[local, store.queue_index['Q2']]
+        wait_times_q3 = waits[remote, store.queue_index['Q3']]
 
         # Распределение по маршрутам
-        local_count = sum(1 for r in self.finished_requests if r.path == 'local')
-        remote_count = sum(1 for r in self.finished_requests if r.path == 'remote')
+        local_count = int(np.count_nonzero(local))
+        remote_count = int(np.count_nonzero(remote))
 
         # Коэффициенты загрузки приборов
         total_time = self.current_time
@@ -614,34 +2014,21 @@ class DistributedDBModel:
             if (self.processed_requests + self.lost_requests) > 0 else 0,
 
             # Статистика по очередям
-            'queue_max': dict(self.stats['queue_max']),
-            'queue_avg': dict(self.stats['queue_avg']),
+            'queue_max': {name: q.max_length for name, q in self.queue_stats.items()},
+            'queue_avg': {name: q.mean(total_time) for name, q in self.queue_stats.items()},
+            'queue_distribution': {name: q.distribution() for name, q in self.queue_stats.items()},
 
             # Статистика по времени
             'system_time': {
-                'min': min(system_times) if system_times else 0,
-                'max': max(system_times) if system_times else 0,
-                'avg': sum(system_times) / len(system_times) if system_times else 0,
-                'std': np.std(system_times) if system_times else 0,
+                **_describe(system_times),
+                'std': float(np.std(system_times)) if system_times.size else 0,
                 'all': system_times
             },
 
             # Статистика по времени ожидания
-            'wait_time_q1': {
-                'min': min(wait_times_q1) if wait_times_q1 else 0,
-                'max': max(wait_times_q1) if wait_times_q1 else 0,
-                'avg': sum(wait_times_q1) / len(wait_times_q1) if wait_times_q1 else 0,
-            },
-            'wait_time_q2': {
-                'min': min(wait_times_q2) if wait_times_q2 else 0,
-                'max': max(wait_times_q2) if wait_times_q2 else 0,
-                'avg': sum(wait_times_q2) / len(wait_times_q2) if wait_times_q2 else 0,
-            },
-            'wait_time_q3': {
-                'min': min(wait_times_q3) if wait_times_q3 else 0,
-                'max': max(wait_times_q3) if wait_times_q3 else 0,
-                'avg': sum(wait_times_q3) / len(wait_times_q3) if wait_times_q3 else 0,
-            },
+            'wait_time_q1': _describe(wait_times_q1),
+            'wait_time_q2': _describe(wait_times_q2),
+            'wait_time_q3': _describe(wait_times_q3),
 
             # Распределение заявок
             'path_distribution': {
@@ -654,12 +2041,16 @@ class DistributedDBModel:
             # Загрузка приборов
             'device_utilization': utilizations,
 
+            # Средние использованных входных случайных величин по потокам
+            'input_means': self._input_means(),
+
             # Количественные показатели приборов
             'device_stats': {
                 name: {
                     'processed': device.total_processed,
                     'busy_time': device.busy_time,
-                    'utilization': device.utilization(total_time)
+                    'utilization': device.utilization(total_time),
+                    **device.summary(),
                 }
                 for name, device in self.devices.items() if name != 'SOURCE'
             }
@@ -721,8 +2112,15 @@ class DistributedDBModel:
 
         print("="*80)
 
-    def plot_results(self, save_path=None):
-        """Построение графиков результатов"""
+    def plot_results(self, save_path=None, show=False, max_points=2000, dpi=300):
+        """Построение графиков результатов
+
+        Ряды длин очередей прореживаются до max_points точек с сохранением
+        экстремумов, гистограмма строится по подсчитанным частотам. Без
+        show=True график только сохраняется (бэкенд Agg) и фигура закрывается.
+        """
+        plt = _pyplot(show)
+
         stats = self.get_statistics()
 
         if not stats:
@@ -738,7 +2136,8 @@ class DistributedDBModel:
         # 1. Гистограмма времени пребывания в системе
         ax1 = plt.subplot(2, 3, 1)
         system_times = stats['system_time']['all']
-        ax1.hist(system_times, bins=30, edgecolor='black', alpha=0.7, color=Config.COLORS['device'])
+        _plot_histogram(ax1, system_times, bins=30, edgecolor='black', alpha=0.7,
+                        color=Config.COLORS['device'])
         ax1.set_xlabel('Время в системе (сек)')
         ax1.set_ylabel('Количество заявок')
         ax1.set_title('Распределение времени пребывания в системе')
@@ -753,11 +2152,12 @@ class DistributedDBModel:
         # 2. Динамика длин очередей
         ax2 = plt.subplot(2, 3, 2)
         colors = ['blue', 'green', 'red']
-        for i, (q_name, q_data) in enumerate(self.stats['queue_lengths'].items()):
-            if q_data:
-                times, lengths = zip(*q_data)
-                ax2.plot(times, lengths, label=f'Очередь {q_name}',
-                         color=colors[i % len(colors)], linewidth=1.5)
+        for i, (q_name, q_stats) in enumerate(self.queue_stats.items()):
+            if q_stats.series is not None and q_stats.series.times:
+                times, values = minmax_downsample(q_stats.series.times, q_stats.series.values,
+                                                  max_points)
+                ax2.plot(times, values, label=f'Очередь {q_name}',
+                         color=colors[i % len(colors)], linewidth=1.5, drawstyle='steps-post')
 
         ax2.set_xlabel('Модельное время (сек)')
         ax2.set_ylabel('Длина очереди')
@@ -843,113 +2243,856 @@ class DistributedDBModel:
                          f'{val:.1f}', ha='center', va='bottom', fontsize=9)
 
         plt.tight_layout()
+        _finish_figure(plt, fig, save_path, show, dpi)
 
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"Графики сохранены в файл: {save_path}")
-
-        plt.show()
+    def plot_queue_length_distribution(self, save_path=None, show=False, dpi=300):
+        """Построение распределения длин очередей (доля модельного времени)"""
+        plt = _pyplot(show)
 
-    def plot_queue_length_distribution(self, save_path=None):
-        """Построение распределения длин очередей"""
-        if not self.stats['queue_lengths']:
+        stats = self.get_statistics()
+        if not stats:
             print("Нет данных о длинах очередей")
             return
 
         fig, axes = plt.subplots(1, 3, figsize=(15, 5))
         fig.suptitle('Распределение длин очередей', fontsize=14, fontweight='bold')
 
-        for idx, (q_name, q_data) in enumerate(self.stats['queue_lengths'].items()):
+        for idx, (q_name, probs) in enumerate(stats['queue_distribution'].items()):
             if idx >= 3:
                 break
 
             ax = axes[idx]
-            if q_data:
-                # Извлечение только длин очередей
-                times, lengths = zip(*q_data)
-
-                # Построение гистограммы
-                max_len = max(lengths)
-                bins = range(0, max_len + 2)
-                ax.hist(lengths, bins=bins, edgecolor='black', alpha=0.7,
-                        color=Config.COLORS['queue'], density=True)
-
-                # Расчет и отображение вероятностей
-                total_samples = len(lengths)
-                unique_lengths = sorted(set(lengths))
-                probs = []
-                for l in unique_lengths:
-                    prob = lengths.count(l) / total_samples
-                    probs.append(prob)
-
-                # Отображение наиболее вероятных длин
-                if len(unique_lengths) > 0:
-                    max_prob_idx = probs.index(max(probs))
-                    most_prob_len = unique_lengths[max_prob_idx]
-                    ax.axvline(most_prob_len, color='red', linestyle='--',
-                               linewidth=1, alpha=0.7,
-                               label=f'Наиболее вероятно: {most_prob_len}')
+            if probs.size:
+                # Гистограмма по заранее накопленным долям времени
+                lengths = np.arange(probs.size)
+                ax.bar(lengths, probs, width=1.0, edgecolor='black', alpha=0.7,
+                       color=Config.COLORS['queue'])
+
+                # Отображение наиболее вероятной длины
+                most_prob_len = int(np.argmax(probs))
+                ax.axvline(most_prob_len, color='red', linestyle='--',
+                           linewidth=1, alpha=0.7,
+                           label=f'Наиболее вероятно: {most_prob_len}')
 
                 ax.set_xlabel(f'Длина очереди {q_name}')
                 ax.set_ylabel('Вероятность')
-                ax.set_title(f'Очередь {q_name}\nМакс: {max_len}, Ср: {self.stats["queue_avg"][q_name]:.2f}')
+                ax.set_title(f'Очередь {q_name}\nМакс: {stats["queue_max"][q_name]}, '
+                             f'Ср: {stats["queue_avg"][q_name]:.2f}')
                 ax.legend()
                 ax.grid(True, alpha=0.3)
 
         plt.tight_layout()
+        _finish_figure(plt, fig, save_path, show, dpi)
 
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
 
-        plt.show()
+# ============================================================================
+# УСЛОВИЯ ОСТАНОВКИ
+# ============================================================================
+
+class ModelTimeLimit:
+    """Остановка на заданном моменте модельного времени"""
+
+    def __init__(self, model_time: float):
+        self.model_time = model_time
+
+    def __call__(self, model) -> bool:
+        return model.current_time >= self.model_time
+
+    def __repr__(self):
+        return f'ModelTimeLimit({self.model_time})'
+
+
+class WallClockLimit:
+    """Остановка по истечении seconds секунд реального времени"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        """Начало отсчета (вызывается из advance_until)"""
+        self.start = time.perf_counter()
+
+    def __call__(self, model) -> bool:
+        return time.perf_counter() - self.start >= self.seconds
+
+    def __repr__(self):
+        return f'WallClockLimit({self.seconds})'
+
+
+class Converged:
+    """Остановка при достижении точности оценки среднего времени пребывания
+
+    Времена пребывания завершенных заявок (в порядке выхода) обрабатываются
+    как в run_steady_state: отбрасывается переходный участок (MSER-5), интервал
+    строится методом пакетных средних. Точность достигнута, если получено не
+    меньше min_batches независимых пакетов размером не меньше min_batch_size
+    и полуширина интервала не больше abs_tol или rel_tol * |среднее|.
+    Оценка пересчитывается, только когда число заявок выросло в growth раз,
+    поэтому частая проверка не замедляет длинный прогон.
+    """
+
+    def __init__(self, rel_tol=0.01, abs_tol=None, confidence=0.95, min_observations=1000,
+                 growth=1.1, min_batches=20, min_batch_size=20):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self.confidence = confidence
+        self.min_observations = min_observations
+        self.growth = growth
+        self.min_batches = min_batches
+        self.min_batch_size = min_batch_size
+        self.reset()
+
+    def reset(self):
+        self.checked = 0
+        self.result = None
+
+    def __call__(self, model) -> bool:
+        n = model.requests.n_finished
+        if n < max(self.min_observations, self.checked * self.growth):
+            return False
+        self.checked = n
+        finished = model.requests.finished_ids()
+        values = model.requests.finish[finished] - model.requests.creation[finished]
+        warmup, warmup_ok = mser_truncation(values)
+        self.result = batch_means(values[warmup:], self.confidence, self.min_batches,
+                                  min_batch_size=self.min_batch_size)
+        self.result.update(warmup=warmup, warmup_ok=warmup_ok, observations=n)
+        target = min(self.abs_tol if self.abs_tol is not None else math.inf,
+                     self.rel_tol * abs(self.result['mean']) if self.rel_tol is not None else math.inf)
+        return (warmup_ok and self.result['independent']
+                and self.result['n_batches'] >= self.min_batches
+                and self.result['batch_size'] >= self.min_batch_size
+                and self.result['half_width'] <= target)
+
+    def __repr__(self):
+        return f'Converged(rel_tol={self.rel_tol}, abs_tol={self.abs_tol})'
+
+
+# ============================================================================
+# СТАТИСТИЧЕСКИЕ ФУНКЦИИ
+# ============================================================================
+
+def _incomplete_beta(a: float, b: float, x: float) -> float:
+    """Регуляризованная неполная бета-функция I_x(a, b) (цепная дробь Лентца)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    if x > (a + 1.0) / (a + b + 2.0):
+        return 1.0 - _incomplete_beta(b, a, 1.0 - x)
+
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1.0 - x)) / a
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= c * d
+        if abs(c * d - 1.0) < 1e-14:
+            break
+    return front * result
+
+def student_t_cdf(t: float, df: float) -> float:
+    """Функция распределения Стьюдента с df степенями свободы"""
+    tail = 0.5 * _incomplete_beta(df / 2.0, 0.5, df / (df + t * t))
+    return 1.0 - tail if t > 0 else tail
+
+def student_t_quantile(p: float, df: float) -> float:
+    """Квантиль распределения Стьюдента уровня p (бисекция по функции распределения)"""
+    if p == 0.5:
+        return 0.0
+    if p < 0.5:
+        return -student_t_quantile(1.0 - p, df)
+    low, high = 0.0, 1.0
+    while student_t_cdf(high, df) < p:
+        high *= 2.0
+    for _ in range(100):
+        mid = 0.5 * (low + high)
+        if student_t_cdf(mid, df) < p:
+            low = mid
+        else:
+            high = mid
+        if high - low < 1e-12 * max(1.0, high):
+            break
+    return 0.5 * (low + high)
+
+def binomial_upper_bound(k: int, n: int, confidence=0.95) -> float:
+    """Верхняя граница Клоппера-Пирсона для вероятности по k успехам из n"""
+    if n <= 0:
+        return 1.0
+    if k >= n:
+        return 1.0
+    if k == 0:
+        return 1.0 - (1.0 - confidence) ** (1.0 / n)
+    # P(X <= k | p) = I_{1-p}(n-k, k+1) убывает по p; ищем p, где она равна 1 - confidence
+    alpha = 1.0 - confidence
+    low, high = k / n, 1.0
+    for _ in range(100):
+        mid = 0.5 * (low + high)
+        if _incomplete_beta(n - k, k + 1, 1.0 - mid) > alpha:
+            low = mid
+        else:
+            high = mid
+    return high
+
+def replication_upper_bound(values, confidence=0.95) -> float:
+    """Односторонняя верхняя граница Стьюдента для среднего по независимым прогонам"""
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    if n < 2:
+        return math.inf
+    std_err = float(values.std(ddof=1)) / math.sqrt(n)
+    return float(values.mean()) + student_t_quantile(confidence, n - 1) * std_err
+
+def confidence_interval(values, confidence=0.95) -> Tuple[float, float]:
+    """Среднее и полуширина доверительного интервала Стьюдента для среднего"""
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    if n == 0:
+        return 0.0, math.inf
+    mean = float(values.mean())
+    if n == 1:
+        return mean, math.inf
+    std_err = float(values.std(ddof=1)) / math.sqrt(n)
+    return mean, student_t_quantile(0.5 + confidence / 2.0, n - 1) * std_err
+
+def mser_truncation(values, batch=5) -> Tuple[int, bool]:
+    """Длина начального переходного участка по правилу MSER-k (по умолчанию MSER-5)
+
+    Наблюдения усредняются группами по batch; отбрасывается начало d групп,
+    минимизирующее SSE(d) / (m - d)^2 по остатку ряда, при d <= m / 2.
+    Возвращает (число отбрасываемых наблюдений, признак надежности): минимум
+    на границе поиска означает, что ряд слишком короток для выхода на режим.
+    """
+    values = np.asarray(values, dtype=float)
+    m = values.size // batch
+    if m < 2:
+        return 0, False
+    means = values[:m * batch].reshape(m, batch).mean(axis=1)
+    sums = np.cumsum(means[::-1])[::-1]
+    sq_sums = np.cumsum((means ** 2)[::-1])[::-1]
+    counts = np.arange(m, 0, -1)
+    mser = (sq_sums - sums ** 2 / counts) / counts ** 2
+    d = int(np.argmin(mser[:m // 2 + 1]))
+    return d * batch, d < m // 2
+
+def batch_means(values, confidence=0.95, min_batches=20, max_batches=1024,
+                max_lag1=0.1, min_batch_size=5, lags=3) -> Dict:
+    """Доверительный интервал среднего по методу непересекающихся пакетов
+
+    Размер пакета - не меньше min_batch_size (как группа MSER-5) и такой, чтобы
+    пакетов было не больше max_batches. Он удваивается, пока модуль хотя бы
+    одной из автокорреляций порядков 1..lags средних пакетов больше max_lag1
+    и пакетов остается не меньше 2 * min_batches. Если ни одно разбиение не
+    прошло проверку, independent = False и интервал занижен.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    size = max(min_batch_size, -(-n // max_batches), 1)
+    while True:
+        k = n // size
+        means = values[:k * size].reshape(k, size).mean(axis=1) if k else values[:0]
+        correlations = _autocorrelations(means, lags)
+        passed = k >= 3 and bool(np.all(np.abs(correlations) <= max_lag1))
+        if passed or k // 2 < min_batches:
+            break
+        size *= 2
+    mean, half = confidence_interval(means, confidence)
+    return {
+        'mean': mean,
+        'half_width': half,
+        'batch_size': size,
+        'n_batches': k,
+        'lag1': float(correlations[0]),
+        'autocorrelation': correlations.tolist(),
+        'independent': passed and k >= min_batches,
+    }
+
+def _autocorrelations(values: np.ndarray, lags=1) -> np.ndarray:
+    """Выборочные автокорреляции порядков 1..lags (нули для слишком коротких рядов)"""
+    result = np.zeros(lags)
+    if values.size < 3:
+        return result
+    centered = values - values.mean()
+    denom = float(np.dot(centered, centered))
+    if denom <= 0:
+        return result
+    for lag in range(1, min(lags, values.size - 1) + 1):
+        result[lag - 1] = float(np.dot(centered[:-lag], centered[lag:])) / denom
+    return result
+
+def metric_value(stats: Dict, path: str) -> float:
+    """Значение показателя из get_statistics() по пути вида 'system_time.avg'"""
+    value = stats
+    for key in path.split('.'):
+        value = value[key]
+    return float(value)
+
+
+# ============================================================================
+# СНИЖЕНИЕ ДИСПЕРСИИ
+# ============================================================================
+
+def input_expectations(config: 'ModelConfig', improved=False) -> Dict[str, float]:
+    """Теоретические средние входных величин по потокам (пары к get_statistics()['input_means'])"""
+    topology = build_topology(improved)
+    expected = {}
+    for spec in [topology['source']] + topology['stations']:
+        law = spec['service']
+        if law[0] == 'uniform':
+            expected[law[3]] = (getattr(config, law[1]) + getattr(config, law[2])) / 2
+        following = spec.get('next')
+        if isinstance(following, tuple):
+            expected[following[2]] = getattr(config, following[1])
+    return expected
+
+def control_variate_estimate(values, controls, expectations, confidence=0.95) -> Dict:
+    """Оценка среднего с контрольными переменными
+
+    values - наблюдения (n,), controls - контрольные величины (n, q) с
+    известными средними expectations (q,). Оценка - свободный член регрессии
+    values на (controls - expectations), интервал - Стьюдента с n - q - 1
+    степенями свободы.
+    """
+    y = np.asarray(values, dtype=float)
+    x = np.asarray(controls, dtype=float).reshape(y.size, -1) - np.asarray(expectations, dtype=float)
+    n, q = x.shape
+    if n <= q + 1:
+        raise ValueError(f"Для {q} контрольных переменных нужно не меньше {q + 2} наблюдений")
+    design = np.column_stack([np.ones(n), x])
+    coef, *_ = np.linalg.lstsq(design, y, rcond=None)
+    residuals = y - design @ coef
+    df = n - q - 1
+    std_err = math.sqrt(float(residuals @ residuals) / df * np.linalg.pinv(design.T @ design)[0, 0])
+    return {
+        'mean': float(coef[0]),
+        'half_width': student_t_quantile(0.5 + confidence / 2.0, df) * std_err,
+        'std_err': std_err,
+        'beta': coef[1:].tolist(),
+    }
+
+def variance_reduction(all_stats, config: 'ModelConfig' = None, improved=False,
+                       metrics=('system_time.avg',), antithetic=False, control_variates=True,
+                       confidence=0.95) -> Dict:
+    """Оценки показателей с антитетическими парами и/или контрольными переменными
+
+    antithetic - all_stats идут парами (run_parallel_replications(antithetic=True)),
+    наблюдением служит среднее пары. Контрольные переменные - средние входных
+    величин прогона (input_means) с известными математическими ожиданиями.
+    Коэффициент снижения дисперсии - отношение дисперсии среднего по тем же
+    прогонам, считающимся независимыми, к дисперсии полученной оценки.
+    """
+    config = config if config is not None else ModelConfig.from_defaults()
+    all_stats = [stats for stats in all_stats if stats]
+    expected = input_expectations(config, improved) if control_variates else {}
+    streams = [name for name in expected if all(name in s['input_means'] for s in all_stats)]
+    controls = np.array([[s['input_means'][name] for name in streams] for s in all_stats])
+    controls = controls.reshape(len(all_stats), len(streams))
+    if antithetic:
+        controls = controls.reshape(len(all_stats) // 2, 2, len(streams)).mean(axis=1)
+    # Величины без разброса (например, маршрут при P_LOCAL = 1) не несут информации
+    useful = [i for i in range(len(streams)) if np.ptp(controls[:, i]) > 0]
+    streams = [streams[i] for i in useful]
+    controls = controls[:, useful]
+
+    report = {'n_runs': len(all_stats), 'antithetic': antithetic, 'controls': streams,
+              'confidence': confidence, 'metrics': {}}
+    for path in metrics:
+        values = np.array([metric_value(s, path) for s in all_stats])
+        plain_var = float(values.var(ddof=1)) / values.size
+        observations = values.reshape(-1, 2).mean(axis=1) if antithetic else values
+        if streams:
+            result = control_variate_estimate(observations, controls,
+                                              [expected[name] for name in streams], confidence)
+            variance = result['std_err'] ** 2
+        else:
+            mean, half_width = confidence_interval(observations, confidence)
+            variance = float(observations.var(ddof=1)) / observations.size
+            result = {'mean': mean, 'half_width': half_width, 'beta': []}
+        result['plain_half_width'] = confidence_interval(values, confidence)[1]
+        result['reduction_factor'] = plain_var / variance if variance > 0 else math.inf
+        report['metrics'][path] = result
+    return report
+
+def print_variance_reduction_report(report):
+    """Вывод оценок со снижением дисперсии"""
+    methods = (['антитетические пары'] if report['antithetic'] else []) + \
+              ([f"контрольные переменные ({', '.join(report['controls'])})"] if report['controls'] else [])
+    print(f"\nСнижение дисперсии: {'; '.join(methods) or 'нет'}, прогонов {report['n_runs']}")
+    for path, m in report['metrics'].items():
+        print(f"   {path:<20}: {m['mean']:.4f} ± {m['half_width']:.4f} "
+              f"(без снижения ± {m['plain_half_width']:.4f}, "
+              f"дисперсия меньше в {m['reduction_factor']:.2f} раза)")
+
+
+# ============================================================================
+# КЭШ РЕЗУЛЬТАТОВ ПРОГОНОВ
+# ============================================================================
+
+# Версия движка моделирования: увеличивается при любом изменении, влияющем
+# на результаты прогонов (сохраненные в кэше результаты становятся недоступны)
+ENGINE_VERSION = 2
+
+
+def replication_key(config: Dict, improved: bool, max_queue_size,
+                    seed_seq: np.random.SeedSequence, antithetic=False) -> str:
+    """Ключ прогона: хеш параметров модели, версии движка и SeedSequence"""
+    description = {
+        'engine': ENGINE_VERSION,
+        'config': config,
+        'improved': bool(improved),
+        'max_queue_size': max_queue_size,
+        'entropy': str(seed_seq.entropy),
+        'spawn_key': list(seed_seq.spawn_key),
+        'pool_size': seed_seq.pool_size,
+    }
+    if antithetic:
+        description['antithetic'] = sorted(VARIATE_STREAMS if antithetic is True else antithetic)
+    text = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Хранилище результатов прогонов (get_statistics) в файле SQLite
+
+    Результат сохраняется сжатым (zlib) по ключу replication_key(). При
+    превышении max_bytes удаляются записи, к которым дольше всего не
+    обращались. Используется только в основном процессе.
+    """
+
+    def __init__(self, path='cw_cache.sqlite', max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results ('
+                        'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                        'created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Сохраненный результат или None"""
+        row = self.db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, stats: Dict):
+        """Сохранение результата с вытеснением давно не использованных записей"""
+        value = zlib.compress(pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL))
+        now = time.time()
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                        (key, value, len(value), now, now))
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        """Удаление записей по давности обращения до размера max_bytes"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM results ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM results WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def info(self) -> Dict:
+        """Число записей, объем и статистика обращений"""
+        entries, size = self.db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """Удаление всех записей"""
+        self.db.execute('DELETE FROM results')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 # ============================================================================
 # ФУНКЦИИ ДЛЯ ПРОВЕДЕНИЯ ЭКСПЕРИМЕНТОВ
 # ============================================================================
 
-def run_single_experiment(improved=False, seed=None, verbose=False):
-    """Запуск одиночного эксперимента"""
+def run_single_experiment(improved=False, seed=None, verbose=False, quiet=False):
+    """Запуск одиночного эксперимента (quiet - без вывода)"""
     if seed is not None:
         random.seed(seed)
 
-    print(f"\n{'='*60}")
-    print(f"Эксперимент с seed={seed}")
-    print(f"{'='*60}")
+    if not quiet:
+        print(f"\n{'='*60}")
+        print(f"Эксперимент с seed={seed}")
+        print(f"{'='*60}")
 
     model = DistributedDBModel(improved_system=improved)
-    model.run(verbose=verbose)
-    model.print_statistics()
+    model.run(verbose=verbose, quiet=quiet)
+    if not quiet:
+        model.print_statistics()
 
     return model
 
-def run_multiple_experiments(n_runs=10, improved=False):
-    """Запуск серии экспериментов для получения статистически устойчивых результатов"""
-    print(f"\n{'='*80}")
-    print(f"ЗАПУСК СЕРИИ ИЗ {n_runs} ЭКСПЕРИМЕНТОВ")
-    print(f"Улучшенная система: {'ДА' if improved else 'НЕТ'}")
-    print(f"{'='*80}")
-
-    all_stats = []
-    seeds = list(range(1, n_runs + 1))
+def _config_snapshot() -> Dict:
+    """Текущие значения параметров Config (для передачи в рабочие процессы)"""
+    return {name: value for name, value in vars(Config).items() if name.isupper()}
+
+def _replication_model(job) -> 'DistributedDBModel':
+    """Модель прогона по заданию (параметры Config, топология, емкость, SeedSequence
+    и необязательный признак антитетического прогона)"""
+    config, improved, max_queue_size, seed_seq = job[:4]
+    antithetic = len(job) > 4 and job[4]
+    return DistributedDBModel(improved_system=improved, max_queue_size=max_queue_size,
+                              variates=BufferedVariates(seed_seq, antithetic=antithetic),
+                              config=ModelConfig.from_dict(config))
+
+def _run_replication(job) -> Dict:
+    """Один прогон модели в рабочем процессе; возвращает get_statistics()"""
+    model = _replication_model(job)
+    model.run(quiet=True)
+    return model.get_statistics()
+
+def run_round_robin(models, slice_events=1000):
+    """Выполнение нескольких независимых моделей в одном процессе по очереди
+
+    Каждая модель обрабатывает до slice_events событий за ход; завершенные
+    модели выбывают. Результаты совпадают с раздельными вызовами run(), если
+    у моделей собственные источники случайных величин (по умолчанию так и
+    есть); модели с общим источником или общим генератором (rng=random)
+    не принимаются: их результаты зависели бы от slice_events.
+    """
+    sources = set()
+    for model in models:
+        variates = model.variates
+        for source in (variates, getattr(variates, 'rng', None)):
+            if source is None:
+                continue
+            if source is random or id(source) in sources:
+                raise ValueError("Модели с общим источником случайных величин нельзя "
+                                 "выполнять по очереди")
+            sources.add(id(source))
+    active = list(models)
+    while active:
+        for model in active:
+            model._advance(slice_events)
+        remaining = []
+        for model in active:
+            if model.finished:
+                model._finish()
+            else:
+                remaining.append(model)
+        active = remaining
+    return models
+
+def resume(checkpoint_path: str, verbose=False, quiet=True, checkpoint_every=100000):
+    """Продолжение прогона с контрольной точки до завершения
+
+    Результат совпадает с непрерывным прогоном. Контрольные точки продолжают
+    сохраняться в тот же файл.
+    """
+    model = DistributedDBModel.load_checkpoint(checkpoint_path)
+    model.run(verbose=verbose, quiet=quiet, checkpoint_path=checkpoint_path,
+              checkpoint_every=checkpoint_every)
+    return model
 
-    for seed in seeds:
-        print(f"\nЭксперимент {seed}/{n_runs} (seed={seed})...")
-        random.seed(seed)
+def _run_replication_batch(jobs) -> List[Dict]:
+    """Пакет прогонов в одном рабочем процессе (пошагово по очереди)"""
+    models = run_round_robin([_replication_model(job) for job in jobs])
+    return [model.get_statistics() for model in models]
+
+def _run_replications(jobs, workers=None, cache=None, batch=None) -> List[Dict]:
+    """Прогоны по заданиям _run_replication; найденные в кэше не пересчитываются
+
+    batch > 1 - задания передаются процессам пакетами по batch прогонов, что
+    снижает накладные расходы пула на коротких прогонах.
+    """
+    keys = [replication_key(*job) for job in jobs] if cache is not None else None
+    results = [cache.get(key) for key in keys] if cache is not None else [None] * len(jobs)
+    missing = [i for i, stats in enumerate(results) if stats is None]
+    pending = [jobs[i] for i in missing]
+    if batch and batch > 1:
+        batches = [pending[i:i + batch] for i in range(0, len(pending), batch)]
+        computed = [stats for part in _map_jobs(_run_replication_batch, batches, workers)
+                    for stats in part]
+    else:
+        computed = _map_jobs(_run_replication, pending, workers)
+    for i, stats in zip(missing, computed):
+        if cache is not None:
+            cache.put(keys[i], stats)
+        results[i] = stats
+    return results
 
-        model = DistributedDBModel(improved_system=improved)
-        model.run(verbose=False)
+def run_parallel_replications(n_runs=10, improved=False, root_seed=0,
+                              max_queue_size=None, workers=None, seed_seqs=None,
+                              cache=None, batch=None, antithetic=False) -> List[Dict]:
+    """Параллельный запуск независимых прогонов на пуле процессов
+
+    Прогон i получает потоки случайных чисел (BufferedVariates) из
+    SeedSequence(root_seed).spawn(n_runs)[i] (или seed_seqs[i], если список задан
+    явно), поэтому результат (в порядке номеров прогонов) не зависит от числа
+    процессов и совпадает с cw_vector.run_lindley_replications() при тех же n и root_seed.
+    cache (ResultCache) - прогоны, уже сохраненные в кэше, не пересчитываются;
+    batch - число прогонов в одном задании пула (см. _run_replications).
+    antithetic - прогоны идут парами (u, 1 - u) на одной SeedSequence: n_runs / 2
+    пар, результаты пары - соседние элементы списка (см. variance_reduction).
+    Вместо True можно перечислить потоки, в которых берется 1 - u. Выигрыш
+    зависит от показателя и топологии (в базовой системе замена маршрута лишь
+    меняет ЭВМ местами); фактический коэффициент показывает variance_reduction().
+    """
+    config = _config_snapshot()
+    if antithetic and n_runs % 2:
+        raise ValueError("Для антитетических пар нужно четное число прогонов")
+    if seed_seqs is None:
+        seed_seqs = np.random.SeedSequence(root_seed).spawn(n_runs // 2 if antithetic else n_runs)
+    if antithetic:
+        jobs = [(config, improved, max_queue_size, ss, flag) for ss in seed_seqs
+                for flag in (False, antithetic)]
+    else:
+        jobs = [(config, improved, max_queue_size, ss) for ss in seed_seqs]
+    return _run_replications(jobs, workers, cache, batch)
+
+def _map_jobs(func, jobs, workers=None) -> List:
+    """Выполнение заданий на пуле процессов с сохранением порядка результатов"""
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [func(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, jobs))
+
+def _render_replication(job) -> Dict:
+    """Прогон модели и сохранение его графиков в рабочем процессе"""
+    *replication, prefix, options = job
+    model = _replication_model(replication)
+    model.run(quiet=True)
+    model.plot_results(save_path=f'{prefix}_results.png', **options)
+    model.plot_queue_length_distribution(save_path=f'{prefix}_queues.png',
+                                         dpi=options.get('dpi', 300))
+    return model.get_statistics()
+
+def render_replications(directory, n_runs=10, improved=False, root_seed=0,
+                        max_queue_size=None, workers=None, max_points=2000, dpi=100) -> List[Dict]:
+    """Прогоны с сохранением графиков каждого прогона в directory на пуле процессов
+
+    Прогоны совпадают с run_parallel_replications() при тех же параметрах;
+    файлы называются run_NNNN_results.png и run_NNNN_queues.png.
+    """
+    os.makedirs(directory, exist_ok=True)
+    config = _config_snapshot()
+    options = {'max_points': max_points, 'dpi': dpi}
+    jobs = [(config, improved, max_queue_size, seed_seq,
+             os.path.join(directory, f'run_{i:04d}'), options)
+            for i, seed_seq in enumerate(np.random.SeedSequence(root_seed).spawn(n_runs))]
+    return _map_jobs(_render_replication, jobs, workers)
+
+def run_multiple_experiments(n_runs=10, improved=False, root_seed=0, workers=None, cache=None,
+                             antithetic=False, control_variates=False,
+                             metrics=('system_time.avg',), quiet=False):
+    """Запуск серии экспериментов для получения статистически устойчивых результатов
+
+    antithetic и control_variates включают снижение дисперсии (variance_reduction);
+    его результаты - в aggregated['variance_reduction']. quiet - без вывода
+    заголовка и итогов, как model.run(quiet=True).
+    """
+    if not quiet:
+        print(f"\n{'='*80}")
+        print(f"ЗАПУСК СЕРИИ ИЗ {n_runs} ЭКСПЕРИМЕНТОВ")
+        print(f"Улучшенная система: {'ДА' if improved else 'НЕТ'}")
+        print(f"{'='*80}")
 
-        stats = model.get_statistics()
-        all_stats.append(stats)
+    start_time_wall = time.time()
+    all_stats = run_parallel_replications(n_runs, improved=improved, root_seed=root_seed,
+                                          workers=workers, cache=cache, antithetic=antithetic)
+    if not quiet:
+        print(f"\nВыполнено {n_runs} прогонов (root_seed={root_seed}) "
+              f"за {time.time() - start_time_wall:.2f} сек")
 
     # Агрегация результатов
     aggregated = aggregate_statistics(all_stats)
-    print_aggregated_results(aggregated, improved)
+    if not quiet:
+        print_aggregated_results(aggregated, improved)
+
+    if antithetic or control_variates:
+        aggregated['variance_reduction'] = variance_reduction(
+            all_stats, improved=improved, metrics=metrics, antithetic=antithetic,
+            control_variates=control_variates)
+        if not quiet:
+            print_variance_reduction_report(aggregated['variance_reduction'])
 
     return all_stats, aggregated
 
-def aggregate_statistics(all_stats):
+def run_sequential_experiments(improved=False, metrics=('system_time.avg',),
+                               rel_tol=0.05, abs_tol=None, confidence=0.95,
+                               batch_size=None, min_runs=5, max_runs=200,
+                               max_wall_time=None, root_seed=0, max_queue_size=None,
+                               workers=None, cache=None):
+    """Последовательная серия прогонов до достижения заданной точности
+
+    Прогоны запускаются пакетами, пока полуширина доверительного интервала
+    Стьюдента каждого показателя из metrics не станет меньше abs_tol или
+    rel_tol * |среднее|, либо пока не исчерпан лимит прогонов max_runs или
+    реального времени max_wall_time (сек). Первые n прогонов совпадают с
+    run_parallel_replications(n, root_seed=root_seed).
+
+    Возвращает (all_stats, aggregated, report), где report содержит по каждому
+    показателю среднее, полуширину интервала и признак достижения точности.
+    """
+    if rel_tol is None and abs_tol is None:
+        raise ValueError("Нужно задать rel_tol и/или abs_tol")
+
+    batch_size = batch_size or max(os.cpu_count() or 1, 2)
+    root = np.random.SeedSequence(root_seed)
+    start_time_wall = time.time()
+    all_stats = []
+
+    while True:
+        n_new = min(max(batch_size, min_runs - len(all_stats)), max_runs - len(all_stats))
+        all_stats += run_parallel_replications(improved=improved, max_queue_size=max_queue_size,
+                                               workers=workers, seed_seqs=root.spawn(n_new),
+                                               cache=cache)
+
+        report = {'metrics': {}, 'n_runs': len(all_stats)}
+        for path in metrics:
+            mean, half_width = confidence_interval(
+                [metric_value(s, path) for s in all_stats if s], confidence)
+            target = min(abs_tol if abs_tol is not None else math.inf,
+                         rel_tol * abs(mean) if rel_tol is not None else math.inf)
+            report['metrics'][path] = {
+                'mean': mean,
+                'half_width': half_width,
+                'ci_low': mean - half_width,
+                'ci_high': mean + half_width,
+                'target': target,
+                'converged': half_width <= target,
+            }
+
+        if len(all_stats) >= min_runs and all(m['converged'] for m in report['metrics'].values()):
+            report['reason'] = 'precision'
+        elif len(all_stats) >= max_runs:
+            report['reason'] = 'max_runs'
+        elif max_wall_time is not None and time.time() - start_time_wall >= max_wall_time:
+            report['reason'] = 'wall_time'
+        else:
+            continue
+        break
+
+    report['wall_time'] = time.time() - start_time_wall
+    return all_stats, aggregate_statistics(all_stats, confidence), report
+
+def print_sequential_report(report):
+    """Вывод итогов последовательной серии прогонов"""
+    reasons = {'precision': 'достигнута заданная точность',
+               'max_runs': 'исчерпан лимит прогонов',
+               'wall_time': 'исчерпан лимит времени'}
+    print(f"\nПрогонов: {report['n_runs']} ({reasons[report['reason']]}, "
+          f"{report['wall_time']:.2f} сек)")
+    for path, m in report['metrics'].items():
+        mark = '✓' if m['converged'] else '✗'
+        print(f"   {mark} {path:<30}: {m['mean']:.4f} ± {m['half_width']:.4f} "
+              f"(цель ± {m['target']:.4f})")
+
+def run_steady_state(improved=False, n_requests=200000, confidence=0.95, bin_width=None,
+                     seed=0, min_batches=20, max_batches=1024, max_lag1=0.1, config=None):
+    """Стационарный режим по одному длинному прогону
+
+    Наблюдения: времена пребывания в системе (в порядке выхода заявок) и
+    средние длины очередей по интервалам bin_width (по умолчанию - десять
+    средних интервалов между заявками). Переходный участок каждого ряда
+    отбрасывается по правилу MSER-5, доверительный интервал строится по
+    методу пакетных средних (batch_means).
+
+    Возвращает (stats, report): get_statistics() прогона и по каждому ряду
+    оценку среднего с полушириной интервала и длиной переходного участка.
+    """
+    config = (config or ModelConfig.from_defaults()).with_changes(TOTAL_REQUESTS=n_requests)
+    if bin_width is None:
+        bin_width = 5.0 * (config.GEN_MIN + config.GEN_MAX)
+
+    model = DistributedDBModel(improved_system=improved, recording='off',
+                               queue_series_points=0, queue_bin_width=bin_width,
+                               variates=BufferedVariates(seed), config=config)
+    model.run(quiet=True)
+    stats = model.get_statistics()
+
+    series = {'system_time': stats['system_time']['all']}
+    for name, q_stats in model.queue_stats.items():
+        series[f'queue_{name}'] = q_stats.bin_means(stats['total_time'])
+
+    report = {'n_requests': n_requests, 'bin_width': bin_width,
+              'confidence': confidence, 'metrics': {}}
+    for name, values in series.items():
+        warmup, warmup_ok = mser_truncation(values)
+        result = batch_means(values[warmup:], confidence, min_batches, max_batches, max_lag1)
+        result.update(observations=len(values), warmup=warmup, warmup_ok=warmup_ok)
+        report['metrics'][name] = result
+    return stats, report
+
+def print_steady_state_report(report):
+    """Вывод оценок стационарного режима"""
+    print(f"\nСтационарный режим: {report['n_requests']} заявок, "
+          f"интервал усреднения очередей {report['bin_width']:.1f} сек, "
+          f"доверительная вероятность {report['confidence']:.0%}")
+    for name, m in report['metrics'].items():
+        mark = '✓' if m['warmup_ok'] and m['independent'] else '✗'
+        print(f"   {mark} {name:<15}: {m['mean']:.4f} ± {m['half_width']:.4f} "
+              f"(отброшено {m['warmup']} из {m['observations']}, "
+              f"{m['n_batches']} пакетов по {m['batch_size']}, r1 = {m['lag1']:.3f})")
+
+def check_converged_coverage(n_runs=20, rel_tol=0.05, confidence=0.95, root_seed=0,
+                             reference_requests=200000, max_requests=10 ** 6, config=None) -> Dict:
+    """Проверка правила Converged: покрывают ли интервалы остановленных прогонов эталон
+
+    Каждый из n_runs прогонов (seed = root_seed + i) идет до срабатывания
+    Converged(rel_tol); эталон - среднее время пребывания независимого
+    длинного прогона run_steady_state (seed = root_seed + n_runs). Проверка
+    пройдена ('ok'), если доля покрытий не меньше confidence с запасом в два
+    стандартных отклонения биномиальной доли.
+    """
+    config = config or ModelConfig.from_defaults()
+    _, reference = run_steady_state(n_requests=reference_requests, confidence=confidence,
+                                    seed=root_seed + n_runs, config=config)
+    target = reference['metrics']['system_time']['mean']
+
+    runs = []
+    for i in range(n_runs):
+        model = DistributedDBModel(recording='off', queue_series_points=0,
+                                   variates=BufferedVariates(root_seed + i),
+                                   config=config.with_changes(TOTAL_REQUESTS=max_requests))
+        condition = Converged(rel_tol=rel_tol, confidence=confidence)
+        stopped = model.advance_until(condition) is condition
+        result = dict(condition.result, stopped=stopped,
+                      covered=abs(condition.result['mean'] - target) <= condition.result['half_width'])
+        runs.append(result)
+
+    coverage = sum(r['covered'] for r in runs) / n_runs
+    slack = 2 * math.sqrt(confidence * (1 - confidence) / n_runs)
+    return {
+        'reference': target,
+        'coverage': coverage,
+        'ok': all(r['stopped'] for r in runs) and coverage >= confidence - slack,
+        'runs': runs,
+    }
+
+def aggregate_statistics(all_stats, confidence=0.95):
     """Агрегация статистики по нескольким экспериментам"""
     if not all_stats:
         return {}
@@ -987,13 +3130,16 @@ def aggregate_statistics(all_stats):
         # Общее время
         aggregated['total_time'].append(stats['total_time'])
 
-    # Расчет средних значений и доверительных интервалов
+    # Расчет средних значений и доверительных интервалов (Стьюдента для среднего)
+    system_time_mean, system_time_half = confidence_interval(aggregated['system_time_avg'],
+                                                             confidence)
     result = {
         'system_time': {
             'mean': np.mean(aggregated['system_time_avg']),
             'std': np.std(aggregated['system_time_avg']),
-            'ci_low': np.percentile(aggregated['system_time_avg'], 2.5),
-            'ci_high': np.percentile(aggregated['system_time_avg'], 97.5),
+            'ci_low': system_time_mean - system_time_half,
+            'ci_high': system_time_mean + system_time_half,
+            'confidence': confidence,
         },
         'queue_max': {},
         'queue_avg': {},
@@ -1036,7 +3182,8 @@ def print_aggregated_results(aggregated, improved):
     print(f"\n1. ВРЕМЯ ПРЕБЫВАНИЯ В СИСТЕМЕ:")
     sys_time = aggregated['system_time']
     print(f"   Среднее: {sys_time['mean']:.2f} ± {sys_time['std']:.2f} сек")
-    print(f"   95% доверительный интервал: [{sys_time['ci_low']:.2f}, {sys_time['ci_high']:.2f}] сек")
+    print(f"   {sys_time['confidence']:.0%} доверительный интервал: "
+          f"[{sys_time['ci_low']:.2f}, {sys_time['ci_high']:.2f}] сек")
 
     print(f"\n2. МАКСИМАЛЬНЫЕ ДЛИНЫ ОЧЕРЕДЕЙ:")
     for q_name, q_stats in aggregated['queue_max'].items():
@@ -1059,52 +3206,318 @@ def print_aggregated_results(aggregated, improved):
 
     print(f"{'='*80}")
 
-def determine_queue_capacity(target_loss_prob=0.001, max_capacity=100):
-    """Определение необходимой емкости накопителей"""
-    print(f"\n{'='*80}")
-    print(f"ОПРЕДЕЛЕНИЕ ЕМКОСТИ НАКОПИТЕЛЕЙ ДЛЯ ВЕРОЯТНОСТИ ПОТЕРИ < {target_loss_prob}")
-    print(f"{'='*80}")
-
-    capacities = list(range(5, max_capacity + 1, 5))
-    results = []
-
-    for capacity in capacities:
-        print(f"\nТестирование емкости: {capacity}")
-
-        loss_probs = []
-        for seed in range(1, 6):  # 5 прогонов для каждой емкости
-            random.seed(seed)
-            model = DistributedDBModel(improved_system=False, max_queue_size=capacity)
-            model.run(verbose=False)
-            stats = model.get_statistics()
-            loss_prob = stats.get('request_loss_prob', 0)
-            loss_probs.append(loss_prob)
+def _comparison_paths(stats: Dict) -> List[str]:
+    """Пути показателей aggregate_statistics() в get_statistics() прогона"""
+    paths = ['system_time.avg']
+    paths += [f'queue_max.{name}' for name in stats['queue_max']]
+    paths += [f'queue_avg.{name}' for name in stats['queue_avg']]
+    paths += [f'device_utilization.{name}' for name in stats['device_utilization']]
+    return paths + ['path_distribution.local_percent', 'total_time']
+
+def paired_comparison(base_stats, improved_stats, confidence=0.95) -> Dict:
+    """Парное сравнение прогонов двух вариантов на общих случайных числах
+
+    base_stats[i] и improved_stats[i] должны быть получены на одной SeedSequence.
+    Для каждого показателя aggregate_statistics() - средняя разность
+    (улучшенная - базовая) с интервалом Стьюдента по парным разностям, и для
+    сравнения - полуширина интервала Уэлча, как для независимых серий.
+    """
+    pairs = [(b, i) for b, i in zip(base_stats, improved_stats) if b and i]
+    if len(pairs) < 2:
+        raise ValueError("Для парного сравнения нужно не меньше двух пар прогонов")
+    n = len(pairs)
+    report = {'n_pairs': n, 'confidence': confidence, 'metrics': {}}
+    for path in _comparison_paths(pairs[0][0]):
+        base = np.array([metric_value(b, path) for b, _ in pairs])
+        improved = np.array([metric_value(i, path) for _, i in pairs])
+        mean, half_width = confidence_interval(improved - base, confidence)
+
+        # Независимые серии того же объема (интервал Уэлча)
+        var_b, var_i = base.var(ddof=1) / n, improved.var(ddof=1) / n
+        se = math.sqrt(var_b + var_i)
+        df = se ** 4 / ((var_b ** 2 + var_i ** 2) / (n - 1)) if se > 0 else n - 1
+        unpaired = student_t_quantile(0.5 + confidence / 2.0, df) * se if se > 0 else 0.0
+        diff_var = (improved - base).var(ddof=1) / n
+
+        report['metrics'][path] = {
+            'base': float(base.mean()),
+            'improved': float(improved.mean()),
+            'difference': mean,
+            'half_width': half_width,
+            'ci_low': mean - half_width,
+            'ci_high': mean + half_width,
+            'unpaired_half_width': unpaired,
+            'reduction_factor': (var_b + var_i) / diff_var if diff_var > 0 else math.inf,
+            'significant': abs(mean) > half_width,
+        }
+    return report
+
+def run_paired_comparison(n_runs=10, root_seed=0, max_queue_size=None, workers=None,
+                          cache=None, confidence=0.95) -> Dict:
+    """Базовая и улучшенная системы на общих случайных числах (CRN)
+
+    Прогон i обоих вариантов использует одну SeedSequence; потоки
+    поступления, маршрутизации и времен ответа ЭВМ1/ЭВМ2 независимы
+    (BufferedVariates), поэтому каждая заявка получает в обоих вариантах
+    одинаковые момент прихода, маршрут и время ответа.
+    """
+    seed_seqs = np.random.SeedSequence(root_seed).spawn(n_runs)
+    base = run_parallel_replications(max_queue_size=max_queue_size, workers=workers,
+                                     seed_seqs=seed_seqs, cache=cache)
+    improved = run_parallel_replications(improved=True, max_queue_size=max_queue_size,
+                                         workers=workers, seed_seqs=seed_seqs, cache=cache)
+    return paired_comparison(base, improved, confidence)
+
+def print_paired_comparison(report):
+    """Вывод парного сравнения вариантов"""
+    print(f"\nПарное сравнение (улучшенная - базовая), {report['n_pairs']} пар прогонов, "
+          f"доверительная вероятность {report['confidence']:.0%}")
+    for path, m in report['metrics'].items():
+        mark = '*' if m['significant'] else ' '
+        print(f"  {mark} {path:<32}: {m['base']:10.3f} → {m['improved']:10.3f}  "
+              f"разность {m['difference']:+10.3f} ± {m['half_width']:.3f} "
+              f"(независимые серии ± {m['unpaired_half_width']:.3f})")
+    print("  * - разность значима")
+
+def find_queue_capacity(target_loss_prob=0.001, n_runs=20, improved=False,
+                        max_capacity=1024, root_seed=0, confidence=0.95,
+                        criterion='upper', workers=None, on_evaluate=None, cache=None) -> Dict:
+    """Поиск минимальной емкости накопителя с P(потери) < target_loss_prob
+
+    Емкость сначала удваивается до выполнения условия (поиск интервала), затем
+    интервал делится целочисленной бисекцией. Все емкости оцениваются на одних
+    и тех же n_runs потоках случайных чисел (общие случайные числа), а на каждом
+    шаге одновременно проверяется столько емкостей, сколько рабочих процессов.
+
+    Вероятность потери - среднее долей потерь (потеряно / поступило) по прогонам.
+    Потери идут сериями при заполненном накопителе, поэтому заявки нельзя
+    считать независимыми испытаниями: верхняя граница уровня confidence
+    строится по прогонам (односторонняя граница Стьюдента), а граница
+    Клоппера-Пирсона по всем заявкам используется лишь как нижний предел
+    для нее (когда потерь нет или их доли во всех прогонах одинаковы).
+    criterion='upper' требует, чтобы цели удовлетворяла верхняя граница,
+    criterion='mean' - точечная оценка. on_evaluate(entry) вызывается для каждой
+    проверенной емкости.
+    """
+    if criterion not in ('upper', 'mean'):
+        raise ValueError(f"Неизвестный критерий: {criterion}")
+
+    config = _config_snapshot()
+    seed_seqs = np.random.SeedSequence(root_seed).spawn(n_runs)
+    width = max(workers or os.cpu_count() or 1, 1)
+    evaluations = {}
+
+    def evaluate(capacities):
+        """Оценка вероятности потери для еще не проверенных емкостей"""
+        capacities = sorted(set(c for c in capacities if c not in evaluations))
+        jobs = [(config, improved, c, ss) for c in capacities for ss in seed_seqs]
+        all_stats = _run_replications(jobs, workers, cache)
+        for i, capacity in enumerate(capacities):
+            runs = all_stats[i * n_runs:(i + 1) * n_runs]
+            run_lost = [s.get('lost_requests', 0) for s in runs]
+            run_arrived = [l + s.get('processed_requests', 0) for l, s in zip(run_lost, runs)]
+            run_loss = [l / a if a else 0.0 for l, a in zip(run_lost, run_arrived)]
+            lost, arrived = sum(run_lost), sum(run_arrived)
+            loss_prob = float(np.mean(run_loss))
+            upper = max(replication_upper_bound(run_loss, confidence),
+                        binomial_upper_bound(lost, arrived, confidence))
+            entry = {
+                'capacity': capacity,
+                'loss_prob': loss_prob,
+                'upper_bound': upper,
+                'run_loss': run_loss,
+                'lost': lost,
+                'arrived': arrived,
+                'meets_target': (upper if criterion == 'upper' else loss_prob) < target_loss_prob,
+            }
+            evaluations[capacity] = entry
+            if on_evaluate is not None:
+                on_evaluate(entry)
+
+    # Поиск интервала [lo, hi]: lo не удовлетворяет условию (0 - фиктивно), hi удовлетворяет
+    lo, hi = 0, None
+    candidate = 1
+    while hi is None and lo < max_capacity:
+        batch = []
+        while len(batch) < width and candidate <= max_capacity:
+            batch.append(candidate)
+            candidate *= 2
+        if candidate > max_capacity and max_capacity not in batch and len(batch) < width + 1:
+            batch.append(max_capacity)
+            candidate = max_capacity + 1
+        evaluate(batch)
+        for capacity in batch:
+            if evaluations[capacity]['meets_target']:
+                hi = capacity
+                break
+            lo = capacity
+
+    # Целочисленная бисекция (с несколькими точками деления на шаге)
+    while hi is not None and hi - lo > 1:
+        step = (hi - lo) / (min(width, hi - lo - 1) + 1)
+        points = sorted(set(int(lo + step * i) for i in range(1, width + 1)) - {lo, hi})
+        points = [c for c in points if lo < c < hi]
+        evaluate(points)
+        for capacity in points:
+            if evaluations[capacity]['meets_target']:
+                hi = capacity
+                break
+            lo = capacity
 
-        avg_loss_prob = np.mean(loss_probs)
-        print(f"  Средняя вероятность потери: {avg_loss_prob:.6f}")
+    result = {
+        'capacity': hi,
+        'target_loss_prob': target_loss_prob,
+        'confidence': confidence,
+        'criterion': criterion,
+        'n_runs': n_runs,
+        'evaluations': [evaluations[c] for c in sorted(evaluations)],
+    }
+    if hi is not None:
+        best = evaluations[hi]
+        result['loss_prob'] = best['loss_prob']
+        result['upper_bound'] = best['upper_bound']
+        result['statement'] = (
+            f"Емкость {hi}: P(потери) = {best['loss_prob']:.6f}, с доверием {confidence:.0%} "
+            f"не более {best['upper_bound']:.6f} (граница по {n_runs} прогонам, "
+            f"{best['lost']} потерь из {best['arrived']} заявок)")
+        if hi > 1:
+            result['statement'] += f"; емкость {hi - 1} цели не удовлетворяет"
+    else:
+        result['statement'] = f"Цель не достигнута при емкости до {max_capacity}"
+    return result
 
-        results.append({
-            'capacity': capacity,
-            'loss_prob': avg_loss_prob,
-            'meets_target': avg_loss_prob < target_loss_prob
-        })
+def determine_queue_capacity(target_loss_prob=0.001, max_capacity=100, n_runs=20, workers=None,
+                             cache=None, cross_check=False, improved=False, ctmc_service_phases=20):
+    """Определение необходимой емкости накопителей
 
-        if avg_loss_prob < target_loss_prob:
-            print(f"  ✓ Цель достигнута!")
-            break
+    cross_check - для каждой проверенной емкости выводится также вероятность
+    потери, рассчитанная по цепи Маркова (cw_ctmc.loss_curve) с теми же
+    параметрами Config и вариантом системы, что и моделирование.
+    ctmc_service_phases - число фаз аппроксимации обслуживания в расчете.
+    """
+    print(f"\n{'='*80}")
+    print(f"ОПРЕДЕЛЕНИЕ ЕМКОСТИ НАКОПИТЕЛЕЙ ДЛЯ ВЕРОЯТНОСТИ ПОТЕРИ < {target_loss_prob}")
+    print(f"{'='*80}")
 
-    # Поиск минимальной емкости, удовлетворяющей требованию
-    suitable_capacities = [r for r in results if r['meets_target']]
-    if suitable_capacities:
-        min_capacity = min(suitable_capacities, key=lambda x: x['capacity'])
+    if cross_check:
+        from cw_ctmc import loss_curve
+        # Параметры передаются явно: при запуске cw.py как скрипта cw_ctmc
+        # импортирует отдельную копию модуля cw со своим Config
+        model_config = ModelConfig.from_dict(_config_snapshot())
+        print(f"  Расчет по цепи Маркова: детерминированное обслуживание заменено "
+              f"{ctmc_service_phases} фазами, поэтому\n  оценка завышена "
+              f"(сходится с моделированием примерно при 120 фазах)")
+
+    def report(entry):
+        mark = '✓' if entry['meets_target'] else '✗'
+        line = (f"  {mark} Емкость {entry['capacity']:>5}: P(потери) = {entry['loss_prob']:.6f} "
+                f"(верхняя граница {entry['upper_bound']:.6f})")
+        if cross_check:
+            estimate = loss_curve([entry['capacity']], model_config, improved,
+                                  service_phases=ctmc_service_phases)[0]['loss_prob']
+            line += f", расчет {estimate:.3e}"
+        print(line)
+
+    result = find_queue_capacity(target_loss_prob, n_runs=n_runs, improved=improved,
+                                 max_capacity=max_capacity, workers=workers,
+                                 on_evaluate=report, cache=cache)
+
+    if result['capacity'] is not None:
         print(f"\n{'='*80}")
         print(f"РЕКОМЕНДУЕМАЯ ЕМКОСТЬ НАКОПИТЕЛЕЙ:")
-        print(f"  Минимальная емкость, обеспечивающая P(потери) < {target_loss_prob}: {min_capacity['capacity']}")
-        print(f"  Соответствующая вероятность потери: {min_capacity['loss_prob']:.6f}")
+        print(f"  Минимальная емкость, обеспечивающая P(потери) < {target_loss_prob}: {result['capacity']}")
+        print(f"  {result['statement']}")
     else:
         print(f"\nНе удалось достичь целевой вероятности потери даже при емкости {max_capacity}")
 
-    return results
+    return result
+
+
+# ============================================================================
+# ПРОГРАММНЫЙ ИНТЕРФЕЙС БЕЗ ВЫВОДА
+# ============================================================================
+
+@dataclass
+class SimulationResult:
+    """Основные показатели одного прогона (полная статистика - в stats)"""
+    improved: bool
+    total_time: float
+    processed_requests: int
+    lost_requests: int
+    loss_prob: float
+    system_time_avg: float
+    system_time_std: float
+    system_time_max: float
+    local_percent: float
+    events_processed: int
+    wall_time: float
+    queue_avg: Dict[str, float] = field(default_factory=dict)
+    queue_max: Dict[str, int] = field(default_factory=dict)
+    wait_time_avg: Dict[str, float] = field(default_factory=dict)
+    utilization: Dict[str, float] = field(default_factory=dict)
+    stats: Dict = field(default_factory=dict, repr=False)
+
+
+def simulate(improved=False, max_queue_size=None, seed=None, n_requests=None,
+             recording='off', variates=None, config=None) -> SimulationResult:
+    """Один прогон модели без вывода на экран и без построения графиков
+
+    seed - число или SeedSequence для потокового источника BufferedVariates
+    (None - случайная инициализация); variates задает источник явно.
+    config - ModelConfig (по умолчанию текущие значения Config), n_requests
+    заменяет в нем TOTAL_REQUESTS.
+    """
+    if variates is None:
+        variates = BufferedVariates(seed)
+    config = config or ModelConfig.from_defaults()
+    if n_requests is not None:
+        config = config.with_changes(TOTAL_REQUESTS=n_requests)
+
+    start_time_wall = time.perf_counter()
+    model = DistributedDBModel(improved_system=improved, max_queue_size=max_queue_size,
+                               recording=recording, queue_series_points=0,
+                               variates=variates, config=config)
+    model.run(quiet=True)
+    stats = model.get_statistics()
+    wall_time = time.perf_counter() - start_time_wall
+
+    return SimulationResult(
+        improved=improved,
+        total_time=stats['total_time'],
+        processed_requests=stats['processed_requests'],
+        lost_requests=stats['lost_requests'],
+        loss_prob=stats['request_loss_prob'],
+        system_time_avg=stats['system_time']['avg'],
+        system_time_std=stats['system_time']['std'],
+        system_time_max=stats['system_time']['max'],
+        local_percent=stats['path_distribution']['local_percent'],
+        events_processed=model.stats['events_processed'],
+        wall_time=wall_time,
+        queue_avg=stats['queue_avg'],
+        queue_max=stats['queue_max'],
+        wait_time_avg={name: stats[f'wait_time_{name.lower()}']['avg'] for name in stats['queue_max']},
+        utilization=stats['device_utilization'],
+        stats=stats,
+    )
+
+
+def measure_overhead(n_runs=200, n_requests=1) -> Dict:
+    """Время импорта модуля (в отдельном процессе) и постоянные затраты на прогон
+
+    Затраты на прогон - медиана времени simulate() для n_requests заявок.
+    """
+    probe = ("import sys, time; t = time.perf_counter(); import cw; "
+             "print(time.perf_counter() - t, 'matplotlib' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.split()
+
+    timings = sorted(simulate(seed=i, n_requests=n_requests).wall_time for i in range(n_runs))
+    return {
+        'import_time': float(output[0]),
+        'imports_matplotlib': output[1] == 'True',
+        'run_overhead': timings[len(timings) // 2],
+        'n_requests': n_requests,
+    }
 
 
 # ============================================================================
@@ -1135,13 +3548,15 @@ def main():
         )
 
         # Построение графиков
-        model.plot_results(save_path=f'results_{"improved" if IMPROVED_SYSTEM else "base"}.png')
-        model.plot_queue_length_distribution(save_path=f'queues_{"improved" if IMPROVED_SYSTEM else "base"}.png')
+        model.plot_results(save_path=f'results_{"improved" if IMPROVED_SYSTEM else "base"}.png',
+                           show=True)
+        model.plot_queue_length_distribution(save_path=f'queues_{"improved" if IMPROVED_SYSTEM else "base"}.png',
+                                             show=True)
 
         # Дополнительная информация
         print("\nПервые 10 обработанных заявок:")
-        for i, req in enumerate(model.finished_requests[:10]):
-            print(f"  {req}")
+        for rid in model.requests.finished_ids()[:10]:
+            print(f"  {model.requests.request(rid)}")
 
     if MULTIPLE_EXPERIMENTS:
         # Серия экспериментов для базовой системы
@@ -1177,6 +3592,9 @@ def main():
                 reduction = (base_max - improved_max) / base_max * 100
                 print(f"  Очередь {q_name}: {base_max:.0f} → {improved_max:.0f} (-{reduction:.1f}%)")
 
+        # Обе серии получены на общих случайных числах (один root_seed)
+        print_paired_comparison(paired_comparison(base_stats, improved_stats))
+
     if DETERMINE_CAPACITY:
         # Определение необходимой емкости накопителей
         determine_queue_capacity(target_loss_prob=0.001, max_capacity=100)
@@ -0,0 +1,179 @@
+"""
+АНАЛИТИЧЕСКАЯ ОЦЕНКА МОДЕЛИ РАСПРЕДЕЛЕННОГО БАНКА ДАННЫХ
+Декомпозиция сети обслуживания на отдельные узлы G/G/c без моделирования:
+загрузка, средние длины очередей и времена пребывания в стационарном режиме.
+
+Каждый узел описывается интенсивностью и квадратом коэффициента вариации
+(SCV) входящего потока и времени обслуживания. Ожидание - приближение
+Аллена-Каннина (для одного прибора совпадает с формулой Кингмана):
+    Wq = C(c, a) / (c*mu - lambda) * (ca2 + cs2) / 2,
+C - вероятность ожидания Эрланга. SCV выходящего потока узла (Уитт):
+    cd2 = 1 + (1 - rho^2) * (ca2 - 1) + rho^2 / sqrt(c) * (cs2 - 1),
+при ветвлении с вероятностью p: ca2 = p * cd2 + 1 - p.
+
+Оценки приближенные (бесконечные очереди, стационарный режим) и служат для
+предварительного отбора конфигураций: узел с rho >= 1 неустойчив, и
+моделировать такую точку плана имеет смысл лишь для переходного режима.
+"""
+
+import math
+from typing import Dict, List
+
+from cw import ModelConfig, build_topology
+
+
+# ============================================================================
+# ХАРАКТЕРИСТИКИ УЗЛА
+# ============================================================================
+
+def service_moments(spec, config: ModelConfig) -> tuple:
+    """Среднее и SCV закона обслуживания из описания топологии"""
+    kind = spec[0]
+    if kind == 'const':
+        return getattr(config, spec[1]), 0.0
+    if kind == 'uniform':
+        low, high = getattr(config, spec[1]), getattr(config, spec[2])
+        mean = (low + high) / 2
+        return mean, ((high - low) ** 2 / 12) / mean ** 2 if mean > 0 else 0.0
+    raise ValueError(f"Неизвестный закон обслуживания: {kind}")
+
+
+def erlang_c(servers: int, load: float) -> float:
+    """Вероятность ожидания в M/M/c при предложенной нагрузке load = lambda / mu"""
+    rho = load / servers
+    if rho >= 1:
+        return 1.0
+    term, total = 1.0, 1.0
+    for k in range(1, servers):
+        term *= load / k
+        total += term
+    tail = term * load / servers / (1 - rho)
+    return tail / (total + tail)
+
+
+def analyze_station(rate: float, ca2: float, mean_service: float, cs2: float,
+                    servers: int) -> Dict:
+    """Показатели узла G/G/c по интенсивности и SCV входящего потока"""
+    load = rate * mean_service
+    rho = load / servers
+    stable = rho < 1
+    if stable:
+        wait = (erlang_c(servers, load) / (servers / mean_service - rate)
+                * (ca2 + cs2) / 2 if rate > 0 else 0.0)
+    else:
+        wait = math.inf
+    cd2 = 1 + (1 - min(rho, 1) ** 2) * (ca2 - 1) + min(rho, 1) ** 2 / math.sqrt(servers) * (cs2 - 1)
+    return {
+        'rate': rate,
+        'ca2': ca2,
+        'service_mean': mean_service,
+        'cs2': cs2,
+        'servers': servers,
+        'load': load,              # Предложенная нагрузка (как device_utilization модели)
+        'rho': rho,                # Загрузка одного прибора
+        'stable': stable,
+        'wait': wait,              # Среднее ожидание в очереди
+        'queue': rate * wait if stable else math.inf,
+        'sojourn': wait + mean_service,
+        'cd2': cd2,
+        # Выходящий поток не может быть интенсивнее производительности узла
+        'departure_rate': min(rate, servers / mean_service),
+    }
+
+
+# ============================================================================
+# СЕТЬ
+# ============================================================================
+
+def analyze(config: ModelConfig = None, improved=None) -> Dict:
+    """Оценка всех узлов и системы в целом
+
+    improved - вариант топологии (по умолчанию config.IMPROVED_SYSTEM).
+    Ключи queue_avg, device_utilization и system_time.avg соответствуют
+    get_statistics() модели, что позволяет сравнить оценки с моделированием.
+    """
+    config = config if config is not None else ModelConfig.from_defaults()
+    improved = config.IMPROVED_SYSTEM if improved is None else improved
+    topology = build_topology(improved)
+    specs = {spec['name']: spec for spec in topology['stations']}
+
+    interval, ca2 = service_moments(topology['source']['service'], config)
+    stations = {}
+    routes = {}
+
+    # Обход дерева узлов: (узел, интенсивность, SCV, маршрут, время пребывания до узла)
+    pending = [(topology['source']['next'], 1 / interval, ca2, None, 0.0)]
+    while pending:
+        name, rate, ca2, route, elapsed = pending.pop()
+        spec = specs[name]
+        mean_service, cs2 = service_moments(spec['service'], config)
+        station = stations[name] = analyze_station(rate, ca2, mean_service, cs2, spec['servers'])
+        station['queue_name'] = spec['queue']
+        elapsed += station['sojourn']
+
+        following = spec['next']
+        rate, ca2 = station['departure_rate'], station['cd2']
+        if following is None:
+            routes[route] = elapsed
+        elif isinstance(following, tuple):
+            p = getattr(config, following[1])
+            for (target, label), share in ((following[3], p), (following[4], 1 - p)):
+                pending.append((target, rate * share, share * ca2 + 1 - share, label, elapsed))
+        else:
+            pending.append((following, rate, ca2, route, elapsed))
+
+    # Узлы в порядке описания топологии
+    stations = {spec['name']: stations[spec['name']] for spec in topology['stations']
+                if spec['name'] in stations}
+    split = next(spec['next'] for spec in specs.values() if isinstance(spec['next'], tuple))
+    p_local = getattr(config, split[1])
+    system_time = p_local * routes['local'] + (1 - p_local) * routes['remote']
+    unstable = [name for name, station in stations.items() if not station['stable']]
+    bottleneck = max(stations, key=lambda name: stations[name]['rho'])
+
+    return {
+        'improved': improved,
+        'arrival_rate': 1 / interval,
+        'stations': stations,
+        'stable': not unstable,
+        'unstable': unstable,
+        'bottleneck': bottleneck,
+        'queue_avg': {s['queue_name']: s['queue'] for s in stations.values() if s['queue_name']},
+        'device_utilization': {name: s['load'] for name, s in stations.items()},
+        'route_time': routes,
+        'system_time': {'avg': system_time},
+    }
+
+
+def screen_design(design: List[Dict], base: ModelConfig = None, max_rho=1.0) -> List[bool]:
+    """Признаки устойчивости точек плана cw_sweep (все узлы с rho < max_rho)"""
+    base = base if base is not None else ModelConfig.from_defaults()
+    flags = []
+    for point in design:
+        result = analyze(base.with_changes(**point))
+        flags.append(max(s['rho'] for s in result['stations'].values()) < max_rho)
+    return flags
+
+
+def print_analytic_report(result: Dict):
+    """Вывод аналитических оценок"""
+    title = "улучшенная" if result['improved'] else "базовая"
+    print(f"\nАналитическая оценка ({title} система), "
+          f"интенсивность поступления {result['arrival_rate']:.4f} заявок/сек")
+    print(f"   {'Узел':<12} {'rho':>6} {'ca2':>6} {'cs2':>6} {'Lq':>9} {'Wq':>9} {'W':>9}")
+    for name, s in result['stations'].items():
+        mark = ' ' if s['stable'] else '!'
+        print(f" {mark} {name:<12} {s['rho']:6.3f} {s['ca2']:6.3f} {s['cs2']:6.3f} "
+              f"{s['queue']:9.3f} {s['wait']:9.3f} {s['sojourn']:9.3f}")
+    if result['stable']:
+        print(f"   Среднее время в системе: {result['system_time']['avg']:.2f} сек "
+              f"(локальные {result['route_time']['local']:.2f}, "
+              f"удаленные {result['route_time']['remote']:.2f})")
+    else:
+        print(f"   Система неустойчива: {', '.join(result['unstable'])}")
+    print(f"   Узкое место: {result['bottleneck']}")
+
+
+if __name__ == "__main__":
+    for improved in (False, True):
+        print_analytic_report(analyze(improved=improved))
@@ -0,0 +1,231 @@
+"""
+НАБОР ТЕСТОВ ПРОИЗВОДИТЕЛЬНОСТИ МОДЕЛИ РАСПРЕДЕЛЕННОГО БАНКА ДАННЫХ
+Каждый случай (число заявок, базовая/улучшенная система, ограничение очереди)
+выполняется в отдельном процессе при фиксированном seed: измеряются скорость
+(событий в секунду), пиковая память и контрольная сумма статистики.
+
+    python cw_bench.py run --output bench.json
+    python cw_bench.py run --sizes 400 100000 10000000 --output bench.json
+    python cw_bench.py compare baseline.json bench.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from itertools import product
+from typing import Dict, List
+
+import numpy as np
+
+DEFAULT_SIZES = (400, 10 ** 4, 10 ** 5, 10 ** 6)
+DEFAULT_QUEUE_LIMIT = 10
+
+
+# ============================================================================
+# ОДИН СЛУЧАЙ
+# ============================================================================
+
+def statistics_digest(stats: Dict) -> str:
+    """Контрольная сумма get_statistics(): точные значения всех показателей"""
+    digest = hashlib.sha256()
+
+    def feed(path, value):
+        if isinstance(value, dict):
+            for key in sorted(value):
+                feed(f'{path}.{key}', value[key])
+        elif isinstance(value, np.ndarray):
+            digest.update(f'{path}:{value.dtype}:{value.shape}:'.encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, float):
+            digest.update(f'{path}={value.hex()};'.encode())
+        else:
+            digest.update(f'{path}={value!r};'.encode())
+
+    feed('', stats)
+    return digest.hexdigest()
+
+
+def run_case(size: int, improved: bool, max_queue_size, seed: int) -> Dict:
+    """Прогон одного случая в текущем процессе"""
+    from cw import ModelConfig, DistributedDBModel, BufferedVariates, peak_rss_mb
+
+    rss_before = peak_rss_mb()
+    model = DistributedDBModel(improved_system=improved, max_queue_size=max_queue_size,
+                               variates=BufferedVariates(seed),
+                               config=ModelConfig.from_defaults(TOTAL_REQUESTS=size))
+    start = time.perf_counter()
+    model.run(quiet=True)
+    run_time = time.perf_counter() - start
+    stats = model.get_statistics()
+    total_time = time.perf_counter() - start
+    rss_after = peak_rss_mb()
+
+    events = model.stats['events_processed']
+    return {
+        'size': size,
+        'improved': improved,
+        'max_queue_size': max_queue_size,
+        'seed': seed,
+        'events': events,
+        'run_time': run_time,
+        'total_time': total_time,
+        'events_per_sec': events / run_time if run_time > 0 else 0.0,
+        'peak_rss_mb': rss_after,
+        'bytes_per_request': ((rss_after - rss_before) * 1024 * 1024 / size
+                              if rss_after is not None else None),
+        'store_bytes_per_request': model.requests.nbytes() / size,
+        'digest': statistics_digest(stats),
+    }
+
+
+def _case_key(case: Dict) -> str:
+    """Ключ случая для сопоставления с эталоном"""
+    return (f"{case['size']}/{'improved' if case['improved'] else 'base'}/"
+            f"q{case['max_queue_size'] or '-'}/s{case['seed']}")
+
+
+def _run_case_subprocess(size, improved, max_queue_size, seed) -> Dict:
+    """Прогон случая в новом процессе интерпретатора (чистая пиковая память)"""
+    args = [sys.executable, os.path.abspath(__file__), 'case', '--size', str(size),
+            '--seed', str(seed)]
+    if improved:
+        args.append('--improved')
+    if max_queue_size:
+        args += ['--max-queue-size', str(max_queue_size)]
+    output = subprocess.run(args, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output)
+
+
+# ============================================================================
+# НАБОР СЛУЧАЕВ
+# ============================================================================
+
+def _environment() -> Dict:
+    """Описание окружения запуска"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run_suite(sizes=DEFAULT_SIZES, queue_limit=DEFAULT_QUEUE_LIMIT, seed=0, repeats=3,
+              verbose=True) -> Dict:
+    """Все сочетания размера, топологии и ограничения очереди
+
+    Каждый случай повторяется repeats раз в отдельных процессах; в отчет
+    попадает самый быстрый повтор (наименее искаженный фоновой нагрузкой),
+    контрольная сумма обязана совпасть во всех повторах.
+    """
+    results = []
+    for size, improved, limit in product(sizes, (False, True), (None, queue_limit)):
+        runs = [_run_case_subprocess(size, improved, limit, seed) for _ in range(repeats)]
+        if len({run['digest'] for run in runs}) != 1:
+            raise RuntimeError(f"Недетерминированный результат в случае {_case_key(runs[0])}")
+        best = min(runs, key=lambda run: run['run_time'])
+        best['key'] = _case_key(best)
+        best['repeats'] = repeats
+        results.append(best)
+        if verbose:
+            print(f"{best['key']:<32} {best['events_per_sec']:>12.0f} соб/сек  "
+                  f"{best['run_time']:8.3f} сек  {best['peak_rss_mb']:8.1f} МБ")
+    return {'environment': _environment(), 'results': results}
+
+
+# ============================================================================
+# СРАВНЕНИЕ С ЭТАЛОНОМ
+# ============================================================================
+
+def compare(baseline: Dict, current: Dict, speed_tol=0.10, memory_tol=0.10) -> List[Dict]:
+    """Сравнение результатов с эталоном; возвращает список регрессий
+
+    Регрессия: скорость ниже эталона более чем на speed_tol, пиковая память
+    выше более чем на memory_tol или отличающаяся контрольная сумма статистики.
+    """
+    reference = {case['key']: case for case in baseline['results']}
+    regressions = []
+    for case in current['results']:
+        base = reference.get(case['key'])
+        if base is None:
+            continue
+        speedup = case['events_per_sec'] / base['events_per_sec'] if base['events_per_sec'] else 1.0
+        memory = (case['peak_rss_mb'] / base['peak_rss_mb']
+                  if base['peak_rss_mb'] and case['peak_rss_mb'] else 1.0)
+        problems = []
+        if speedup < 1.0 - speed_tol:
+            problems.append('скорость')
+        if memory > 1.0 + memory_tol:
+            problems.append('память')
+        if case['digest'] != base['digest']:
+            problems.append('результат')
+        row = {'key': case['key'], 'speedup': speedup, 'memory_ratio': memory,
+               'identical': case['digest'] == base['digest'], 'problems': problems}
+        print(f"{'✗' if problems else '✓'} {case['key']:<32} ускорение {speedup:6.2f}x  "
+              f"память {memory:5.2f}x  {'совпадает' if row['identical'] else 'ОТЛИЧАЕТСЯ'}")
+        if problems:
+            regressions.append(row)
+    return regressions
+
+
+# ============================================================================
+# ТОЧКА ВХОДА
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Тесты производительности модели cw.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='запуск набора случаев')
+    run.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    run.add_argument('--queue-limit', type=int, default=DEFAULT_QUEUE_LIMIT)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--repeats', type=int, default=3)
+    run.add_argument('--output', default='bench.json')
+
+    case = commands.add_parser('case', help='один случай (JSON в stdout)')
+    case.add_argument('--size', type=int, required=True)
+    case.add_argument('--improved', action='store_true')
+    case.add_argument('--max-queue-size', type=int, default=None)
+    case.add_argument('--seed', type=int, default=0)
+
+    cmp = commands.add_parser('compare', help='сравнение с эталоном')
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--speed-tol', type=float, default=0.10)
+    cmp.add_argument('--memory-tol', type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == 'case':
+        print(json.dumps(run_case(args.size, args.improved, args.max_queue_size, args.seed)))
+    elif args.command == 'run':
+        report = run_suite(args.sizes, args.queue_limit, args.seed, args.repeats)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в файл: {args.output}")
+    elif args.command == 'compare':
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.speed_tol, args.memory_tol)
+        print(f"Регрессий: {len(regressions)}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
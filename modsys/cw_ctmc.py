@@ -0,0 +1,232 @@
+"""
+ЧИСЛЕННЫЙ РАСЧЕТ ВЕРОЯТНОСТИ ПОТЕРИ В МОДЕЛИ РАСПРЕДЕЛЕННОГО БАНКА ДАННЫХ
+Заявки теряются только на входе: при заполненном накопителе Q1 первого узла
+(max_queue_size). Последующие узлы не блокируют предыдущие, поэтому потери
+определяются подсистемой ИСТОЧНИК -> Q1 -> EV1_PRIMARY.
+
+Равномерное и детерминированное времена заменяются фазовыми распределениями
+(смесь распределений Эрланга порядков k-1 и k с общей интенсивностью,
+совпадающая по двум первым моментам). Состояние цепи Маркова с непрерывным
+временем - (фаза поступления, число заявок в узле, фаза обслуживания).
+Генератор хранится в разреженном виде (массивы строк, столбцов и
+интенсивностей), стационарное распределение находится итерациями по
+равномеризованной цепи. Для нескольких емкостей решение для предыдущей
+емкости используется как начальное приближение.
+
+Детерминированное время аппроксимируется конечным числом фаз, поэтому для
+очень малых вероятностей (как при параметрах по умолчанию) результат -
+оценка сверху порядка величины, а не точное значение.
+"""
+
+import math
+from typing import Dict, List
+
+import numpy as np
+
+from cw import ModelConfig, build_topology
+
+
+# ============================================================================
+# ФАЗОВЫЕ РАСПРЕДЕЛЕНИЯ
+# ============================================================================
+
+def phase_fit(mean: float, scv: float, max_phases=50) -> tuple:
+    """Смесь Эрланга (k, интенсивность фазы, p) со средним mean и SCV scv
+
+    С вероятностью p обслуживание начинается со второй фазы (k-1 фаз),
+    иначе с первой (k фаз). При scv < 1/max_phases используется Эрланг
+    порядка max_phases (наименьший достижимый SCV), при scv >= 1 -
+    экспоненциальное распределение.
+    """
+    if scv >= 1:
+        return 1, 1 / mean, 0.0
+    k = min(max(math.ceil(1 / scv) if scv > 0 else max_phases, 1), max_phases)
+    if scv < 1 / k:
+        return k, k / mean, 0.0
+    p = (k * scv - math.sqrt(k * (1 + scv) - k * k * scv)) / (1 + scv)
+    return k, (k - p) / mean, p
+
+
+def _law_moments(spec, config: ModelConfig) -> tuple:
+    """Среднее и SCV закона обслуживания из описания топологии"""
+    if spec[0] == 'const':
+        return getattr(config, spec[1]), 0.0
+    low, high = getattr(config, spec[1]), getattr(config, spec[2])
+    mean = (low + high) / 2
+    return mean, (high - low) ** 2 / 12 / mean ** 2
+
+
+# ============================================================================
+# ГЕНЕРАТОР ЦЕПИ
+# ============================================================================
+
+def build_generator(arrival: tuple, service: tuple, capacity: int) -> Dict:
+    """Разреженный генератор цепи для накопителя емкости capacity
+
+    arrival, service - результаты phase_fit(). Состояния: n = 0 (узел пуст,
+    индекс - фаза поступления a) и n = 1..capacity+1 (в узле n заявок,
+    индекс k_a + ((n-1) * k_s + s) * k_a + a). Нумерация не зависит от
+    емкости: цепь большей емкости лишь добавляет уровни в конец.
+    """
+    ka, rate_a, pa = arrival
+    ks, rate_s, ps = service
+    levels = capacity + 1
+    n_states = ka * (1 + levels * ks)
+
+    # Координаты всех состояний
+    a = np.tile(np.arange(ka), 1 + levels * ks)
+    n = np.concatenate([np.zeros(ka, dtype=int), np.repeat(np.arange(1, levels + 1), ka * ks)])
+    s = np.concatenate([np.zeros(ka, dtype=int), np.tile(np.repeat(np.arange(ks), ka), levels)])
+
+    def index(a, n, s):
+        return np.where(n == 0, a, ka + ((n - 1) * ks + s) * ka + a)
+
+    rows, cols, rates = [], [], []
+
+    def add(mask, a_to, n_to, s_to, rate):
+        if np.any(mask) and rate > 0:
+            rows.append(np.flatnonzero(mask))
+            cols.append(index(a_to[mask], n_to[mask], s_to[mask]))
+            rates.append(np.full(rows[-1].size, rate))
+
+    # Фазы поступления; следующий интервал начинается с фазы 0 или 1 (вероятность pa)
+    add(a < ka - 1, a + 1, n, s, rate_a)
+    done = a == ka - 1
+    grow = n + np.minimum(levels - n, 1)
+    for start_a, share_a in ((0, 1 - pa), (1, pa)):
+        if start_a >= ka:
+            continue
+        next_a = np.full_like(a, start_a)
+        add(done & (n > 0), next_a, grow, s, rate_a * share_a)
+        # В пустом узле обслуживание тоже может начаться со второй фазы
+        for start_s, share_s in ((0, 1 - ps), (1, ps)):
+            if start_s < ks:
+                add(done & (n == 0), next_a, grow, np.full_like(s, start_s),
+                    rate_a * share_a * share_s)
+
+    # Фазы обслуживания; следующая заявка начинает с фазы 0 или 1 (вероятность ps)
+    busy = n > 0
+    add(busy & (s < ks - 1), a, n, s + 1, rate_s)
+    leave = busy & (s == ks - 1)
+    add(leave & (n == 1), a, n - 1, np.zeros_like(s), rate_s)
+    for start, share in ((0, 1 - ps), (1, ps)):
+        if start < ks:
+            add(leave & (n > 1), a, n - 1, np.full_like(s, start), rate_s * share)
+
+    rows, cols, rates = np.concatenate(rows), np.concatenate(cols), np.concatenate(rates)
+    return {
+        'rows': rows, 'cols': cols, 'rates': rates, 'n_states': n_states,
+        'level': n, 'arrival_phase': a,
+        # Поток потерь: окончание интервала поступления при заполненном накопителе
+        'loss_rate': np.where(done & (n == levels), rate_a, 0.0),
+        'arrival_rate': np.where(done, rate_a, 0.0),
+    }
+
+
+def stationary_distribution(chain: Dict, start=None, tol=1e-12, max_iter=500000,
+                            check_every=50) -> tuple:
+    """Стационарное распределение pi (pi Q = 0) итерациями по равномеризованной цепи
+
+    Возвращает (pi, число итераций, норма невязки ||pi Q||_1).
+    """
+    rows, cols, rates, n = chain['rows'], chain['cols'], chain['rates'], chain['n_states']
+    out_rate = np.bincount(rows, weights=rates, minlength=n)
+    uniform_rate = out_rate.max() * 1.01
+    stay = 1 - out_rate / uniform_rate
+    weights = rates / uniform_rate
+
+    pi = np.full(n, 1 / n) if start is None else np.asarray(start, dtype=float).copy()
+    pi /= pi.sum()
+    residual = math.inf
+    iteration = 0
+    while iteration < max_iter:
+        for _ in range(check_every):
+            previous = pi
+            pi = pi * stay + np.bincount(cols, weights=pi[rows] * weights, minlength=n)
+        iteration += check_every
+        pi /= pi.sum()
+        # pi P - pi = pi Q / uniform_rate
+        residual = np.abs(pi - previous).sum() * uniform_rate
+        if residual < tol:
+            break
+    return pi, iteration, residual
+
+
+# ============================================================================
+# ВЕРОЯТНОСТЬ ПОТЕРИ
+# ============================================================================
+
+def _entry_fits(config: ModelConfig, improved: bool, arrival_phases, service_phases) -> tuple:
+    """Фазовые распределения интервала поступления и обслуживания первого узла"""
+    topology = build_topology(improved)
+    first = next(spec for spec in topology['stations']
+                 if spec['name'] == topology['source']['next'])
+    if first['servers'] != 1:
+        raise ValueError("Расчет поддерживает только один прибор на входе сети")
+    arrival = phase_fit(*_law_moments(topology['source']['service'], config), arrival_phases)
+    service = phase_fit(*_law_moments(first['service'], config), service_phases)
+    return arrival, service
+
+
+def _solve_capacities(capacities, config, improved, arrival_phases, service_phases, tol):
+    """Решения для емкостей в порядке возрастания (генератор словарей-результатов)"""
+    config = config if config is not None else ModelConfig.from_defaults()
+    arrival, service = _entry_fits(config, improved, arrival_phases, service_phases)
+    previous = None
+    for capacity in sorted(capacities):
+        if capacity < 1:
+            raise ValueError("Емкость накопителя должна быть не меньше 1")
+        chain = build_generator(arrival, service, capacity)
+
+        # Начальное приближение - решение для меньшей емкости (нумерация
+        # состояний от емкости не зависит, новые уровни пусты)
+        start = None
+        if previous is not None:
+            start = np.zeros(chain['n_states'])
+            start[:previous.size] = previous
+        pi, iterations, residual = stationary_distribution(chain, start, tol)
+        previous = pi
+
+        arrivals = pi @ chain['arrival_rate']
+        waiting = np.maximum(chain['level'] - 1, 0)
+        yield {
+            'capacity': capacity,
+            'loss_prob': float(pi @ chain['loss_rate'] / arrivals),
+            'queue_avg': float(pi @ waiting),
+            'utilization': float(pi[chain['level'] > 0].sum()),
+            'n_states': chain['n_states'],
+            'iterations': iterations,
+            'residual': float(residual),
+        }
+
+
+def loss_curve(capacities: List[int], config: ModelConfig = None, improved=False,
+               arrival_phases=50, service_phases=20, tol=1e-12) -> List[Dict]:
+    """Вероятность потери и средняя длина Q1 для каждой емкости накопителя
+
+    Емкость - max_queue_size модели (число ожидающих заявок, не считая
+    обслуживаемой). arrival_phases и service_phases ограничивают число фаз
+    аппроксимации: больше фаз - точнее и медленнее.
+    """
+    return list(_solve_capacities(capacities, config, improved, arrival_phases,
+                                  service_phases, tol))
+
+
+def find_queue_capacity_ctmc(target_loss_prob=0.001, config: ModelConfig = None, improved=False,
+                             max_capacity=100, arrival_phases=50, service_phases=20,
+                             tol=1e-12) -> Dict:
+    """Минимальная емкость накопителя с расчетной P(потери) < target_loss_prob"""
+    entries = []
+    for entry in _solve_capacities(range(1, max_capacity + 1), config, improved,
+                                   arrival_phases, service_phases, tol):
+        entries.append(entry)
+        if entry['loss_prob'] < target_loss_prob:
+            return {'capacity': entry['capacity'], 'evaluations': entries}
+    return {'capacity': None, 'evaluations': entries}
+
+
+if __name__ == "__main__":
+    for entry in loss_curve([1, 2, 3, 5, 10], ModelConfig.from_defaults(GEN_MIN=0.5, GEN_MAX=3.5)):
+        print(f"Емкость {entry['capacity']:>3}: P(потери) = {entry['loss_prob']:.6e}, "
+              f"Lq = {entry['queue_avg']:.4f} ({entry['n_states']} состояний, "
+              f"{entry['iterations']} итераций)")
@@ -0,0 +1,233 @@
+"""
+ПЕРЕБОР ПАРАМЕТРОВ МОДЕЛИ РАСПРЕДЕЛЕННОГО БАНКА ДАННЫХ
+План эксперимента (сетка или латинский гиперкуб) по параметрам Config,
+прогоны (точка, номер прогона) на пуле процессов с динамической раздачей
+заданий, результаты - в pandas.DataFrame и построчно в CSV-файл.
+
+Прогон r каждой точки использует SeedSequence(root_seed).spawn(n_reps)[r]:
+точки сравниваются на общих случайных числах. При повторном запуске с тем
+же файлом output уже посчитанные прогоны пропускаются, поэтому прерванный
+перебор можно продолжить.
+"""
+
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import product
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from cw import (ModelConfig, _config_snapshot, _run_replication, replication_key,
+                confidence_interval, metric_value)
+from cw_analytic import screen_design
+
+# Параметры Config, допустимые в плане эксперимента
+SWEEP_PARAMETERS = ('GEN_MIN', 'GEN_MAX', 'PRIM_TIME', 'ANS_MIN', 'ANS_MAX',
+                    'TRANS_TIME', 'P_LOCAL', 'IMPROVED_SYSTEM', 'TOTAL_REQUESTS')
+
+# Показатели, сохраняемые для каждого прогона
+DEFAULT_METRICS = ('system_time.avg', 'system_time.max', 'request_loss_prob',
+                   'queue_avg.Q1', 'queue_avg.Q2', 'queue_avg.Q3',
+                   'queue_max.Q1', 'queue_max.Q2', 'queue_max.Q3',
+                   'device_utilization.EV1_FINAL', 'device_utilization.EV2_FINAL')
+
+
+# ============================================================================
+# ПЛАНЫ ЭКСПЕРИМЕНТА
+# ============================================================================
+
+def _check_point(point: Dict) -> Dict:
+    """Проверка имен параметров и согласованности границ интервалов"""
+    unknown = set(point) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {sorted(unknown)}")
+    merged = {**_config_snapshot(), **point}
+    for low, high in (('GEN_MIN', 'GEN_MAX'), ('ANS_MIN', 'ANS_MAX')):
+        if merged[low] > merged[high]:
+            raise ValueError(f"{low} > {high} в точке {point}")
+    return point
+
+
+def grid_design(space: Dict[str, List]) -> List[Dict]:
+    """Полный факторный план: все сочетания значений параметров"""
+    names = list(space)
+    return [_check_point(dict(zip(names, values)))
+            for values in product(*(space[name] for name in names))]
+
+
+def lhs_design(bounds: Dict[str, tuple], n_points: int, seed=0) -> List[Dict]:
+    """Латинский гиперкуб: n_points точек, по одной в каждом слое каждого параметра
+
+    bounds - {параметр: (нижняя граница, верхняя граница)}. Целочисленные
+    параметры (TOTAL_REQUESTS) округляются, IMPROVED_SYSTEM задается сеткой.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, (low, high) in bounds.items():
+        strata = (rng.permutation(n_points) + rng.random(n_points)) / n_points
+        values = low + (high - low) * strata
+        columns[name] = np.rint(values).astype(int) if name == 'TOTAL_REQUESTS' else values
+    return [_check_point({name: columns[name][i].item() for name in bounds})
+            for i in range(n_points)]
+
+
+# ============================================================================
+# ВЫПОЛНЕНИЕ
+# ============================================================================
+
+def _point_job(config: Dict, point: Dict, seed_seq, max_queue_size) -> tuple:
+    """Задание _run_replication для точки плана"""
+    merged = {**config, **point}
+    return merged, bool(merged['IMPROVED_SYSTEM']), max_queue_size, seed_seq
+
+
+def _point_row(point_id: int, point: Dict, rep: int, stats: Dict, metrics, wall_time: float) -> Dict:
+    """Строка результатов прогона точки плана"""
+    row = {'point': point_id, 'rep': rep, **point}
+    row.update({path: metric_value(stats, path) for path in metrics})
+    row['wall_time'] = wall_time
+    return row
+
+
+def _sweep_job(job) -> tuple:
+    """Один прогон точки плана в рабочем процессе; строка результатов (и статистика)"""
+    config, point_id, point, rep, seed_seq, metrics, max_queue_size, keep_stats = job
+    start = time.perf_counter()
+    stats = _run_replication(_point_job(config, point, seed_seq, max_queue_size))
+
+    row = _point_row(point_id, point, rep, stats, metrics, time.perf_counter() - start)
+    return row, stats if keep_stats else None
+
+
+def _completed_runs(output: Optional[str]) -> List[Dict]:
+    """Строки, уже сохраненные в CSV-файле предыдущего запуска"""
+    if not output or not os.path.exists(output) or os.path.getsize(output) == 0:
+        return []
+    return pd.read_csv(output, float_precision='round_trip').to_dict('records')
+
+
+def run_sweep(design: List[Dict], n_reps=10, root_seed=0, workers=None, output=None,
+              metrics=DEFAULT_METRICS, max_queue_size=None, on_result=None,
+              max_pending=None, cache=None, skip_unstable=False) -> pd.DataFrame:
+    """Прогоны всех точек плана design по n_reps раз
+
+    Задания (точка, прогон) раздаются процессам по мере освобождения, в
+    обработке не более max_pending заданий (по умолчанию 4 на процесс).
+    Каждая строка сразу дописывается в CSV-файл output и передается в
+    on_result(row). При прерывании (Ctrl+C) возвращаются накопленные строки;
+    повторный вызов с тем же output досчитывает только недостающие прогоны.
+    cache (cw.ResultCache) - прогоны, найденные в кэше (в том числе сделанные
+    run_parallel_replications с теми же параметрами), не пересчитываются.
+    skip_unstable - точки, неустойчивые по аналитической оценке (cw_analytic),
+    не моделируются; номера остальных точек не меняются.
+    """
+    config = _config_snapshot()
+    seed_seqs = np.random.SeedSequence(root_seed).spawn(n_reps)
+    rows = _completed_runs(output)
+    done = {(int(row['point']), int(row['rep'])) for row in rows}
+    if skip_unstable:
+        stable = screen_design(design, ModelConfig.from_dict(config))
+        done |= {(point_id, rep) for point_id, ok in enumerate(stable) if not ok
+                 for rep in range(n_reps)}
+        if not all(stable):
+            print(f"Пропущено неустойчивых точек плана: {stable.count(False)}")
+    jobs = [(config, point_id, point, rep, seed_seqs[rep], tuple(metrics), max_queue_size,
+             cache is not None)
+            for point_id, point in enumerate(design)
+            for rep in range(n_reps) if (point_id, rep) not in done]
+
+    # Прогоны из кэша: строки без моделирования, остальным - ключи для сохранения
+    keys, cached = {}, []
+    if cache is not None:
+        for job in jobs:
+            key = replication_key(*_point_job(job[0], job[2], job[4], job[6]))
+            stats = cache.get(key)
+            if stats is None:
+                keys[job[1], job[3]] = key
+            else:
+                cached.append(_point_row(job[1], job[2], job[3], stats, metrics, 0.0))
+        jobs = [job for job in jobs if (job[1], job[3]) in keys]
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    max_pending = max_pending or 4 * workers
+    fields = ['point', 'rep', *sorted({name for point in design for name in point}),
+              *metrics, 'wall_time']
+
+    csv_file = None
+    writer = None
+    if output:
+        new_file = not rows
+        csv_file = open(output, 'a', newline='', encoding='utf-8')
+        writer = csv.DictWriter(csv_file, fieldnames=fields, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+
+    def collect(result):
+        row, stats = result
+        if stats is not None:
+            cache.put(keys[row['point'], row['rep']], stats)
+        rows.append(row)
+        if writer is not None:
+            writer.writerow(row)
+            csv_file.flush()
+        if on_result is not None:
+            on_result(row)
+
+    try:
+        for row in cached:
+            collect((row, None))
+        if workers <= 1:
+            for job in jobs:
+                collect(_sweep_job(job))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                queue = iter(jobs)
+                try:
+                    while True:
+                        for job in queue:
+                            pending.add(pool.submit(_sweep_job, job))
+                            if len(pending) >= max_pending:
+                                break
+                        if not pending:
+                            break
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            collect(future.result())
+                except KeyboardInterrupt:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+    except KeyboardInterrupt:
+        print(f"\nПеребор прерван: сохранено {len(rows)} прогонов")
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+
+    frame = pd.DataFrame(rows, columns=fields)
+    return frame.sort_values(['point', 'rep'], ignore_index=True)
+
+
+def summarize_sweep(frame: pd.DataFrame, metrics=DEFAULT_METRICS, confidence=0.95) -> pd.DataFrame:
+    """Среднее и полуширина доверительного интервала по каждой точке плана"""
+    parameters = [c for c in frame.columns if c in SWEEP_PARAMETERS]
+    records = []
+    for point_id, group in frame.groupby('point'):
+        record = {'point': point_id, 'n_reps': len(group)}
+        record.update({name: group[name].iloc[0] for name in parameters})
+        for path in metrics:
+            if path in group:
+                mean, half = confidence_interval(group[path].to_numpy(), confidence)
+                record[path] = mean
+                record[f'{path} ±'] = half
+        records.append(record)
+    return pd.DataFrame(records)
+
+
+if __name__ == "__main__":
+    design = grid_design({'P_LOCAL': [0.3, 0.5, 0.7], 'IMPROVED_SYSTEM': [False, True]})
+    frame = run_sweep(design, n_reps=5, output='sweep.csv')
+    print(summarize_sweep(frame)[['point', 'P_LOCAL', 'IMPROVED_SYSTEM',
+                                  'system_time.avg', 'system_time.avg ±']].to_string(index=False))
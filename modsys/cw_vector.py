@@ -0,0 +1,298 @@
+"""
+ВЕКТОРНЫЙ ДВИЖОК МОДЕЛИ РАСПРЕДЕЛЕННОГО БАНКА ДАННЫХ
+Рекуррентные соотношения Линдли (Кифера-Вольфовица для двух приборов) вместо
+календаря событий: R прогонов x N заявок считаются массивами NumPy.
+
+Сеть варианта 18 не имеет обратных связей, все приборы обслуживают заявки
+в порядке FIFO, а ветвление после ЭВМ1 не зависит от состояния системы.
+Поэтому для каждого узла времена окончания обслуживания выражаются через
+времена поступления: D_n = max(A_n, D_{n-1}) + S_n, что для одного прибора
+раскрывается в D_n = C_n + max_{k<=n}(A_k - C_{k-1}), C - накопленная сумма S.
+Заявки, не проходящие через узел, учитываются как A = -inf и S = 0.
+"""
+
+import numpy as np
+from typing import Dict, List
+
+from cw import (ModelConfig, ArrayVariates, DistributedDBModel, VARIATE_STREAMS,
+                stream_generators, _describe)
+
+
+# ============================================================================
+# ВХОДНЫЕ ДАННЫЕ
+# ============================================================================
+
+def draw_uniforms(n_reps: int, n_requests: int, root_seed=0, seed_seqs=None) -> Dict[str, np.ndarray]:
+    """Равномерные U(0, 1) по потокам: массивы формы (n_reps, n_requests)
+
+    Прогон r использует SeedSequence(root_seed).spawn(n_reps)[r] (или
+    seed_seqs[r]) и генераторы stream_generators(), т.е. те же числа, что и
+    событийная модель с потоковым источником случайных величин.
+    """
+    if seed_seqs is None:
+        seed_seqs = np.random.SeedSequence(root_seed).spawn(n_reps)
+    uniforms = {name: np.empty((len(seed_seqs), n_requests)) for name in VARIATE_STREAMS}
+    for r, seed_seq in enumerate(seed_seqs):
+        for name, gen in stream_generators(seed_seq).items():
+            uniforms[name][r] = gen.random(n_requests)
+    return uniforms
+
+
+# ============================================================================
+# РЕКУРРЕНТНЫЕ СООТНОШЕНИЯ
+# ============================================================================
+
+def _single_server(arrivals: np.ndarray, services: np.ndarray, member: np.ndarray):
+    """Начало и окончание обслуживания на одном FIFO-приборе (по строкам)"""
+    a = np.where(member, arrivals, -np.inf)
+    s = np.where(member, services, 0.0)
+    c = np.cumsum(s, axis=1)
+    departures = c + np.maximum.accumulate(a - (c - s), axis=1)
+
+    # Начало обслуживания - момент поступления или окончания предыдущей заявки,
+    # как в событийной модели (без погрешности вычитания s из D)
+    previous = np.empty_like(departures)
+    previous[:, 0] = -np.inf
+    previous[:, 1:] = departures[:, :-1]
+    starts = np.maximum(a, previous)
+    return starts, starts + s
+
+
+def _two_servers(arrivals: np.ndarray, services: np.ndarray, member: np.ndarray):
+    """Начало и окончание обслуживания на двух параллельных FIFO-приборах
+
+    Рекурсия Кифера-Вольфовица по заявкам, векторизованная по прогонам:
+    f1 <= f2 - моменты освобождения приборов. Возвращает также признак
+    одновременной занятости обоих приборов в каком-либо прогоне.
+    """
+    n_reps, n = arrivals.shape
+    f1 = np.full(n_reps, -np.inf)
+    f2 = np.full(n_reps, -np.inf)
+    starts = np.zeros((n_reps, n))
+    both_busy = np.zeros(n_reps, dtype=bool)
+    for j in range(n):
+        m = member[:, j]
+        if not m.any():
+            continue
+        start = np.maximum(arrivals[:, j], f1)
+        finish = start + services[:, j]
+        both_busy |= m & (f2 > start)
+        new_f1 = np.minimum(finish, f2)
+        new_f2 = np.maximum(finish, f2)
+        f1 = np.where(m, new_f1, f1)
+        f2 = np.where(m, new_f2, f2)
+        starts[:, j] = start
+    return starts, starts + services, both_busy
+
+
+def _queue_profile(enter: np.ndarray, start: np.ndarray, total_time: float):
+    """Максимум, площадь и время пребывания очереди в каждой длине
+
+    enter, start - моменты постановки в очередь и начала обслуживания заявок
+    одного прогона. При равных временах постановка учитывается раньше выборки,
+    как в событийной модели (мгновенная длина 1 у заявки без ожидания).
+    """
+    if not enter.size:
+        return 0, 0.0, np.array([1.0])
+    times = np.concatenate([enter, start])
+    deltas = np.concatenate([np.ones(enter.size, dtype=np.int64),
+                             -np.ones(start.size, dtype=np.int64)])
+    order = np.lexsort((-deltas, times))
+    times, lengths = times[order], np.cumsum(deltas[order])
+    durations = np.diff(np.append(times, total_time))
+    time_at_length = np.bincount(lengths, weights=durations)
+    time_at_length[0] += times[0]
+    return int(lengths.max()), float(np.sum(start - enter)), time_at_length / total_time
+
+
+def _device_stats(services: np.ndarray, member: np.ndarray, total_time: float, peak: int) -> Dict:
+    """Показатели прибора в формате device_stats событийной модели"""
+    s = services[member]
+    n = int(s.size)
+    busy_time = float(s.sum())
+    mean = busy_time / n if n else 0.0
+    var = float(np.dot(s, s)) / n - mean ** 2 if n else 0.0
+    return {
+        'processed': n,
+        'busy_time': busy_time,
+        'utilization': busy_time / total_time if total_time > 0 else 0.0,
+        'started': n,
+        'in_service': 0,
+        'peak_parallel': peak if n else 0,
+        'service_time_mean': mean,
+        'service_time_std': var ** 0.5 if var > 0 else 0.0,
+    }
+
+
+def simulate_lindley(uniforms: Dict[str, np.ndarray], improved=False, config=None) -> List[Dict]:
+    """Моделирование R прогонов по входным U(0, 1); статистика как в get_statistics()"""
+    config = config or ModelConfig.from_defaults()
+    u_arrival = uniforms['arrival']
+    n_reps, n = u_arrival.shape
+
+    # Поступление заявок
+    interarrival = config.GEN_MIN + (config.GEN_MAX - config.GEN_MIN) * u_arrival
+    arrivals = np.cumsum(interarrival, axis=1)
+    everyone = np.ones((n_reps, n), dtype=bool)
+
+    # ЭВМ1: первичная обработка и ветвление
+    prim = np.full((n_reps, n), config.PRIM_TIME)
+    ev1p_start, ev1p_end = _single_server(arrivals, prim, everyone)
+    local = uniforms['routing'] < config.P_LOCAL
+    remote = ~local
+
+    def answers(stream, member):
+        """Времена ответа: k-я заявка ветви получает k-е число потока"""
+        rank = np.clip(np.cumsum(member, axis=1) - 1, 0, n - 1)
+        u = np.take_along_axis(uniforms[stream], rank, axis=1)
+        return np.where(member, config.ANS_MIN + (config.ANS_MAX - config.ANS_MIN) * u, 0.0)
+
+    # ЭВМ1: окончательная обработка (один или два прибора)
+    ev1_answer = answers('ev1_answer', local)
+    if improved:
+        ev1f_start, ev1f_end, both_busy = _two_servers(ev1p_end, ev1_answer, local)
+    else:
+        ev1f_start, ev1f_end = _single_server(ev1p_end, ev1_answer, local)
+        both_busy = np.zeros(n_reps, dtype=bool)
+
+    # Канал связи и ЭВМ2
+    trans = np.full((n_reps, n), config.TRANS_TIME)
+    ch_start, ch_end = _single_server(ev1p_end, trans, remote)
+    ev2p_start, ev2p_end = _single_server(ch_end, prim, remote)
+    ev2_answer = answers('ev2_answer', remote)
+    ev2f_start, ev2f_end = _single_server(ev2p_end, ev2_answer, remote)
+
+    finish = np.where(local, ev1f_end, ev2f_end)
+
+    results = []
+    for r in range(n_reps):
+        loc, rem = local[r], remote[r]
+        total_time = float(finish[r].max())
+        order = np.argsort(finish[r], kind='stable')
+        system_times = (finish[r] - arrivals[r])[order]
+
+        queues = {
+            'Q1': (arrivals[r], ev1p_start[r]),
+            'Q2': (ev1p_end[r][loc], ev1f_start[r][loc]),
+            'Q3': (ch_end[r][rem], ev2p_start[r][rem]),
+        }
+        profiles = {name: _queue_profile(enter, start, total_time)
+                    for name, (enter, start) in queues.items()}
+
+        local_count = int(loc.sum())
+
+        # Выборочные средние входных величин, как input_means событийной модели
+        input_means = {'arrival': float(arrivals[r, -1]) / n, 'routing': local_count / n}
+        for stream, answer, member in (('ev1_answer', ev1_answer, loc),
+                                       ('ev2_answer', ev2_answer, rem)):
+            if member.any():
+                input_means[stream] = float(answer[r][member].mean())
+        devices = {
+            'EV1_PRIMARY': _device_stats(prim[r], everyone[r], total_time, 1),
+            'EV1_FINAL': _device_stats(ev1_answer[r], loc, total_time,
+                                       2 if both_busy[r] else 1),
+            'CHANNEL': _device_stats(trans[r], rem, total_time, 1),
+            'EV2_PRIMARY': _device_stats(prim[r], rem, total_time, 1),
+            'EV2_FINAL': _device_stats(ev2_answer[r], rem, total_time, 1),
+        }
+
+        results.append({
+            'total_time': total_time,
+            'processed_requests': n,
+            'lost_requests': 0,
+            'request_loss_prob': 0,
+            'queue_max': {name: p[0] for name, p in profiles.items()},
+            'queue_avg': {name: p[1] / total_time for name, p in profiles.items()},
+            'queue_distribution': {name: p[2] for name, p in profiles.items()},
+            'system_time': {
+                **_describe(system_times),
+                'std': float(np.std(system_times)),
+                'all': system_times,
+            },
+            'wait_time_q1': _describe(ev1p_start[r] - arrivals[r]),
+            'wait_time_q2': _describe(ev1f_start[r][loc] - ev1p_end[r][loc]),
+            'wait_time_q3': _describe(ev2p_start[r][rem] - ch_end[r][rem]),
+            'path_distribution': {
+                'local': local_count,
+                'remote': n - local_count,
+                'local_percent': local_count / n * 100,
+            },
+            'device_utilization': {name: d['utilization'] for name, d in devices.items()},
+            'device_stats': devices,
+            'input_means': input_means,
+        })
+    return results
+
+
+def run_lindley_replications(n_reps=1000, n_requests=None, improved=False, root_seed=0,
+                             max_cells=2 * 10 ** 7, keep_all=True, config=None) -> List[Dict]:
+    """R прогонов векторного движка; n_requests по умолчанию - config.TOTAL_REQUESTS
+
+    Прогоны считаются пачками не более max_cells заявок, чтобы ограничить
+    память. keep_all=False отбрасывает массивы system_time['all'].
+    """
+    config = config or ModelConfig.from_defaults()
+    n_requests = n_requests or config.TOTAL_REQUESTS
+    seed_seqs = np.random.SeedSequence(root_seed).spawn(n_reps)
+    chunk = max(1, max_cells // n_requests)
+    results = []
+    for first in range(0, n_reps, chunk):
+        uniforms = draw_uniforms(0, n_requests, seed_seqs=seed_seqs[first:first + chunk])
+        for stats in simulate_lindley(uniforms, improved=improved, config=config):
+            if not keep_all:
+                del stats['system_time']['all']
+            results.append(stats)
+    return results
+
+
+# ============================================================================
+# СВЕРКА С СОБЫТИЙНОЙ МОДЕЛЬЮ
+# ============================================================================
+
+def _compare(reference, value, path, rtol, diffs):
+    """Рекурсивное сравнение статистик; расхождения добавляются в diffs"""
+    if isinstance(reference, dict):
+        for key, ref in reference.items():
+            _compare(ref, value.get(key), f'{path}.{key}' if path else key, rtol, diffs)
+        return
+    ref = np.asarray(reference, dtype=float)
+    val = np.asarray(value, dtype=float)
+    if ref.shape != val.shape:
+        diffs.append((path, f'размер {ref.shape} != {val.shape}'))
+    elif not np.allclose(ref, val, rtol=rtol, atol=rtol):
+        diffs.append((path, float(np.max(np.abs(ref - val)))))
+
+
+def validate_against_event_engine(n_reps=5, n_requests=2000, improved=False,
+                                  root_seed=0, rtol=1e-9, config=None) -> List:
+    """Сверка векторного движка с событийной моделью на одинаковых входных данных
+
+    Возвращает список расхождений (путь к показателю, величина); пустой
+    список означает совпадение всех показателей с точностью rtol.
+    """
+    config = (config or ModelConfig.from_defaults()).with_changes(TOTAL_REQUESTS=n_requests)
+    uniforms = draw_uniforms(n_reps, n_requests, root_seed)
+    vector_stats = simulate_lindley(uniforms, improved=improved, config=config)
+
+    diffs = []
+    for r in range(n_reps):
+        variates = ArrayVariates({name: values[r] for name, values in uniforms.items()})
+        model = DistributedDBModel(improved_system=improved, variates=variates, config=config)
+        model.run(quiet=True)
+        _compare(model.get_statistics(), vector_stats[r], f'[{r}]', rtol, diffs)
+    return diffs
+
+
+if __name__ == "__main__":
+    import time
+
+    for improved in (False, True):
+        diffs = validate_against_event_engine(improved=improved)
+        print(f"Сверка ({'улучшенная' if improved else 'базовая'} система): "
+              f"{'совпадает' if not diffs else diffs[:5]}")
+
+    start_time_wall = time.time()
+    stats = run_lindley_replications(n_reps=1000, n_requests=10 ** 5, keep_all=False)
+    elapsed = time.time() - start_time_wall
+    avg = np.mean([s['system_time']['avg'] for s in stats])
+    print(f"1000 прогонов x 10^5 заявок: {elapsed:.2f} сек, среднее время в системе {avg:.2f} сек")